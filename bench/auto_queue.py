@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for the IB reader thread marshalling in IBApi.auto_queue.
+
+Compares the old per-tick inspect.signature + bind marshalling with the
+precompiled event records. IBApi normally drops tickSize at the source and
+batches ticks per c.ib.tick_interval; here both tick types are forwarded
+and every tick is flushed on its own, so both sides put one queue item per
+tick and only the marshalling differs. Run from the project root:
+
+    python -m bench.auto_queue
+"""
+import inspect
+import queue
+import time
+
+from trade.api import IBApi
+
+
+def legacy_auto_queue(func):
+    """The marshalling as it was: reflection on every callback"""
+    def wrapper(self, *args, **kwargs):
+        result = func(self, *args, **kwargs)
+        sig = inspect.signature(func)
+        bound = sig.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arg_dict = {k: v for k, v in bound.arguments.items() if k != 'self'}
+        self.ib_to_gui.put({
+            "type": func.__name__,
+            "args": args,
+            "kwargs": arg_dict
+        })
+        return result
+    return wrapper
+
+
+class LegacyApi(IBApi):
+    @legacy_auto_queue
+    def tickPrice(self, reqId: int, tickType: int, price: float, attrib):
+        return
+
+    @legacy_auto_queue
+    def tickSize(self, reqId: int, tickType: int, size: int):
+        return
+
+
+class DrainQueue(queue.SimpleQueue):
+    """Keeps the queue from growing during the run, the cost of put() stays in"""
+    puts = 0
+
+    def put(self, item, block=True, timeout=None):
+        self.puts += 1
+        super().put(item)
+        self.get_nowait()
+
+
+def run(api, n):
+    start = time.perf_counter()
+    for i in range(n):
+        reqId = i % 500
+        # EClient.run calls msgLoopRec after every message, that flushes the tick cache
+        api.tickPrice(reqId, 1, 1.25, None)
+        api.msgLoopRec()
+        api.tickSize(reqId, 0, 10)
+        api.msgLoopRec()
+    return 2 * n / (time.perf_counter() - start)
+
+
+def main(n=100_000):
+    results = {}
+    for name, cls in [("before", LegacyApi), ("after", IBApi)]:
+        api = cls(ib_to_gui=DrainQueue(), forward_ticks={"tickPrice", "tickSize"}, tick_interval=0)
+        results[name] = run(api, n)
+        assert api.ib_to_gui.puts == 2 * n, f"{name}: {api.ib_to_gui.puts} of {2 * n} ticks queued"
+        print(f"{name:>6}: {results[name]:,.0f} ticks/s")
+    print(f"speedup: {results['after'] / results['before']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Benchmarks of the API and controller hot paths on a synthetic option chain.
+
+Every case runs in its own process so its peak RSS can be reported, and
+is driven with 1k, 10k and 100k ticks by default. Results go to a JSON
+file to compare between versions. Run from the project root:
+
+    python -m bench.suite [--sizes 1000 10000] [--cases pipeline ...] [--output bench/results.json]
+
+Per case and size: ticks/s, p50/p99 latency in microseconds and peak RSS.
+For "pipeline" the latency is tick-to-cell: from the IBApi callback until
+the view has formatted the row. For the other cases it is the service
+time per tick, measured over chunks of CHUNK ticks.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+CHUNK = 100
+CONTRACTS = 500  # options in the synthetic chain, the ticks go round robin over them
+FRAME = 250  # ticks arriving per 50ms timer frame in "pipeline"
+
+
+def _view_class():
+    from trade.headless import HeadlessView
+
+    class BenchView(HeadlessView):
+        """HeadlessView that formats ("paints") changed rows right away and stamps when"""
+
+        def __init__(self):
+            super().__init__(queue.SimpleQueue(), queue.Queue(), sink=None, weeks=10)
+            self.painted = []  # perf_counter of every refresh_grid
+
+        def refresh_grid(self, rows):
+            if rows is not None:
+                self.chain_records(rows)
+            self.painted.append(time.perf_counter())
+
+    return BenchView
+
+
+def make_chain(contracts=CONTRACTS):
+    """A view and controller with a streamed chain of puts, returns (view, reqIds)"""
+    view = _view_class()()
+    controller = view.controller
+    controller.lines.max_lines = contracts + 1
+    controller.stock = "BENCH"
+    controller.stockprice = 100.0
+    for i in range(contracts):
+        row = controller.options.add(conId=1000 + i, symbol="BENCH", expiry=20991231,
+                                     strike=80.0 + i * 0.1, right="P")
+        controller.subscribeOption(row)
+    reqIds = list(controller.lines.lines.values())
+    return view, reqIds
+
+
+def option_ticks(n, reqIds):
+    from trade.api import IBApi
+    event = IBApi.tickOptionComputation.event
+    return [event(reqIds[i % len(reqIds)], 13, 0, 0.3, -0.2 - (i % 7) * 0.01, 1.0 + (i % 50) * 0.01,
+                  0.0, 0.05, 0.1, -0.02, 100.0) for i in range(n)]
+
+
+def _chunked(n, step):
+    """Run step(start, stop) over chunks, returns the seconds taken and the per-tick times"""
+    return _timed(n, CHUNK, step)
+
+
+def _timed(n, chunk, step):
+    times = []
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        t = time.perf_counter()
+        step(start, stop)
+        times.append((time.perf_counter() - t) / (stop - start))
+    times = np.repeat(times, chunk)[:n]
+    return float(times.sum()), times
+
+
+def bench_auto_queue(n):
+    """IBApi callbacks on the reader thread, up to the batch put on the queue"""
+    from trade.api import IBApi
+    from bench.auto_queue import DrainQueue
+    api = IBApi(ib_to_gui=DrainQueue(), tick_interval=0.05)
+    reqIds = list(range(1, CONTRACTS + 1))
+
+    def step(start, stop):
+        for i in range(start, stop):
+            reqId = reqIds[i % CONTRACTS]
+            if i % 2:
+                api.tickPrice(reqId, 4, 1.0 + (i % 50) * 0.01, None)
+            else:
+                api.tickOptionComputation(reqId, 13, 0, 0.3, -0.2, 1.0, 0.0, 0.05, 0.1, -0.02, 100.0)
+            api.msgLoopRec()
+    return _chunked(n, step)
+
+
+def bench_dispatch(n):
+    """Controller.process_incoming_data: drain, coalesce and dispatch whole batches"""
+    from trade.events import TickBatchEvent
+    view, reqIds = make_chain()
+    ticks = option_ticks(n, reqIds)
+
+    def step(start, stop):
+        view.ib_to_gui.put(TickBatchEvent(ticks[start:stop]))
+        view.controller.process_incoming_data(time_budget=60, max_messages=n + 1)
+    return _chunked(n, step)
+
+
+def bench_option_computation(n):
+    """Controller.handle_tickOptionComputation alone"""
+    view, reqIds = make_chain()
+    ticks = option_ticks(n, reqIds)
+    handle = view.controller.handle_tickOptionComputation
+
+    def step(start, stop):
+        for tick in ticks[start:stop]:
+            handle(tick)
+    return _chunked(n, step)
+
+
+def bench_render(n):
+    """renderGrid per tick plus one repaintGrid (formatting the dirty rows) per chunk"""
+    view, reqIds = make_chain()
+    controller = view.controller
+    controller.repaintGrid()
+
+    def step(start, stop):
+        for i in range(start, stop):
+            controller.renderGrid(reqIds[i % len(reqIds)])
+        controller.repaintGrid()
+    return _chunked(n, step)
+
+
+def bench_secdef(n):
+    """securityDefinitionOptionParameter merge and fan-out, n expirations over 20 exchanges"""
+    from trade.api import IBApi
+    view, _ = make_chain(0)
+    controller = view.controller
+    controller.conId = 1
+    event = IBApi.securityDefinitionOptionParameter.event
+    end = IBApi.securityDefinitionOptionParameterEnd.event
+    today = datetime.date.today()
+    expirations = [(today + datetime.timedelta(days=1 + i % 70)).strftime("%Y%m%d") for i in range(n)]
+    strikes = {80.0 + i * 0.5 for i in range(100)}
+    exchanges = 20
+    per = max(1, n // exchanges)
+
+    def step(start, stop):
+        # each chunk is one reqSecDefOptParams answered by up to 20 exchanges
+        controller.reqSecDefOptParams()
+        reqId = controller.reqId - 1
+        for i in range(start, stop, per):
+            controller.dispatch(event(reqId, f"EX{i // per}", 1, "BENCH", "100",
+                                      set(expirations[i:min(stop, i + per)]), strikes))
+        controller.dispatch(end(reqId))
+
+    return _timed(n, per * exchanges, step)
+
+
+def bench_pipeline(n):
+    """IBApi callback -> tick batch -> process_incoming_data -> repaintGrid -> formatted row"""
+    from trade.api import IBApi
+    view, reqIds = make_chain()
+    controller = view.controller
+    api = IBApi(ib_to_gui=view.ib_to_gui, tick_interval=0)
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, n, FRAME):
+        stop = min(n, start + FRAME)
+        arrived = []
+        for i in range(start, stop):
+            arrived.append(time.perf_counter())
+            api.tickOptionComputation(reqIds[i % len(reqIds)], 13, 0, 0.3, -0.2 - (i % 7) * 0.01,
+                                      1.0 + (i % 50) * 0.01, 0.0, 0.05, 0.1, -0.02, 100.0)
+        api.flush_ticks()
+        controller.process_incoming_data(time_budget=60, max_messages=n + 1)
+        controller.repaintGrid()
+        painted = view.painted[-1]
+        latencies.extend(painted - t for t in arrived)
+    return time.perf_counter() - started, np.array(latencies)
+
+
+CASES = {
+    "auto_queue": bench_auto_queue,
+    "dispatch": bench_dispatch,
+    "option_computation": bench_option_computation,
+    "render": bench_render,
+    "secdef": bench_secdef,
+    "pipeline": bench_pipeline,
+}
+
+
+def run_case(name, n):
+    """Runs in a fresh process: the numbers of one case at one size"""
+    from trade.cache import CACHE
+    CACHE.enabled = False  # measure the IB path, a warm cache would skip the requests
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        elapsed, latencies = CASES[name](n)
+    return {
+        "ticks": n,
+        "seconds": round(elapsed, 4),
+        "ticks_per_s": round(n / elapsed),
+        "p50_us": round(float(np.percentile(latencies, 50)) * 1e6, 2),
+        "p99_us": round(float(np.percentile(latencies, 99)) * 1e6, 2),
+        # ru_maxrss is in kB on linux, bytes on macOS
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--output", default="bench/results.json")
+    args = parser.parse_args()
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in args.cases:
+        results[name] = {}
+        for n in args.sizes:
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                result = pool.submit(run_case, name, n).result()
+            results[name][str(n)] = result
+            print(f"{name:>18} {n:>7}: {result['ticks_per_s']:>10,} ticks/s  "
+                  f"p50 {result['p50_us']:>9.2f}us  p99 {result['p99_us']:>9.2f}us  rss {result['peak_rss_kb']:,} kB")
+
+    report = {
+        "revision": git_revision(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,114 @@ def wheel(c):
     ]
     return c
 
+def ib(c):
+    c.ib = Stub()
+    # TWS / IB Gateway to connect to; every process on the same TWS needs its own client_id
+    c.ib.host = "127.0.0.1"
+    c.ib.port = 7496
+    c.ib.client_id = 0
+    # IB allows 50 messages per second; a 45/s refill plus a burst of 5
+    # never exceeds that in any one-second window
+    c.ib.messages_per_second = 45
+    c.ib.burst = 5
+    c.ib.command_batch_size = 50
+    # tick callbacks forwarded to the gui, cached per reqId and sent as one batch per interval
+    c.ib.forward_ticks = ["tickPrice", "tickOptionComputation"]
+    c.ib.tick_interval = 0.05
+    # concurrent market data lines the account is entitled to (IB's default is 100)
+    c.ib.max_market_data_lines = 100
+    return c
+
+def window(c):
+    c.window = Stub()
+    # only stream options with a strike within pct of the stock price and/or
+    # among the n strikes on either side of it, None switches a rule off
+    c.window.pct = 0.15
+    c.window.strikes = None
+    # optional |delta| band, e.g. (0.15, 0.35), contracts outside it are cancelled
+    c.window.delta = None
+    # a contract dropped for its delta is retried once the stock moved this much
+    c.window.recheck_pct = 0.02
+    return c
+
+def scan(c):
+    c.scan = Stub()
+    # "stream" keeps a live line per option in the window, "snapshot" takes one
+    # price/greeks reading per option and frees the line again
+    c.scan.mode = "stream"
+    # snapshot requests in flight at once (also bounded by the free market data lines)
+    c.scan.wave_size = 50
+    # rows in the ranked table of "Scan all"
+    c.scan.top = 50
+    return c
+
+def gui(c):
+    c.gui = Stub()
+    # time per 50ms timer frame spent dispatching IB messages, the rest is left for wx
+    c.gui.frame_budget = 0.025
+    # messages taken off the queue per frame at most
+    c.gui.max_messages = 5000
+    return c
+
+def powerx(c):
+    c.powerx = Stub()
+    # stream 5 second bars of the loaded stock and show the PowerX signal whenever it changes
+    c.powerx.bars = False
+    # bar size the signal is computed on, a multiple of IB's 5 second real time bars
+    c.powerx.bar_seconds = 60
+    return c
+
+def metrics(c):
+    c.metrics = Stub()
+    # seconds between two dumps of trade.metrics.METRICS to stderr, None for no dumps
+    c.metrics.dump_interval = None
+    return c
+
+def headless(c):
+    c.headless = Stub()
+    # run.py --headless: expirations loaded (the weeks dropdown of the gui)
+    c.headless.weeks = 2
+    # seconds between two writes of the changed rows, and between two frames
+    c.headless.interval = 1.0
+    c.headless.frame = 0.05
+    return c
+
+def history(c):
+    c.history = Stub()
+    # samples of (time, bid, ask, last, IV, delta) kept per contract, one per frame it changed in
+    c.history.depth = 1024
+    # contracts with a history at most, 48 bytes * depth each
+    c.history.contracts = 256
+    return c
+
+def rank(c):
+    c.rank = Stub()
+    # put candidates kept per stock, best first by "roi", "ppd" or "annual_yield"
+    c.rank.top = 50
+    c.rank.key = "roi"
+    # filters, None switches one off: |delta| band e.g. (0.15, 0.35), minimum
+    # premium (the mid), maximum days to expiry
+    c.rank.delta = None
+    c.rank.min_premium = None
+    c.rank.max_dte = None
+    return c
+
+def greeks(c):
+    c.greeks = Stub()
+    # solve IV and greeks from the bid/ask mid where IB's model ticks are missing or not computed
+    c.greeks.fallback = True
+    # stream IB's model ticks (generic tick 106) per option; off leaves the greeks to the fallback
+    c.greeks.model_ticks = True
+    # risk free rate of the Black-Scholes fallback
+    c.greeks.rate = 0.04
+    return c
+
+def cache(c):
+    c.cache = Stub()
+    # contract details and option chains kept between sessions, None switches the cache off
+    c.cache.path = os.path.join(c.project_root, ".cache", "contracts.sqlite3")
+    return c
+
 def make_c():
     c = Stub()
   
@@ -40,6 +148,17 @@ def make_c():
             general,
             path,
             wheel,
+            ib,
+            window,
+            scan,
+            gui,
+            headless,
+            metrics,
+            powerx,
+            cache,
+            greeks,
+            rank,
+            history,
         ]:
         c = f(c)
     return c
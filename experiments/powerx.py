@@ -1,5 +1,6 @@
 #import simpleNamespace
 from types import SimpleNamespace   
+from collections import deque
 
 #fulldaydata is a list of simpleNamespace objects with fields: date, open, high, low, close
 #for each fulldaydata list entry (from position 26 onward), calculate macd and signal
@@ -75,9 +76,12 @@ def rsi(fulldaydata, period=14):
                 avg_loss = sum(losses[1:period+1]) / period
                 rs = avg_gain / avg_loss if avg_loss != 0 else 0
                 fulldaydata[i].rsi = 100 - (100 / (1 + rs))
+                # the seed of Wilder's smoothing below
+                fulldaydata[i].avg_gain = avg_gain
+                fulldaydata[i].avg_loss = avg_loss
             else:
-                avg_gain = (gains[i] + (period - 1) * (fulldaydata[i-1].avg_gain if hasattr(fulldaydata[i-1], 'avg_gain') else 0)) / period
-                avg_loss = (losses[i] + (period - 1) * (fulldaydata[i-1].avg_loss if hasattr(fulldaydata[i-1], 'avg_loss') else 0)) / period
+                avg_gain = (gains[i] + (period - 1) * fulldaydata[i-1].avg_gain) / period
+                avg_loss = (losses[i] + (period - 1) * fulldaydata[i-1].avg_loss) / period
                 rs = avg_gain / avg_loss if avg_loss != 0 else 0
                 fulldaydata[i].rsi = 100 - (100 / (1 + rs))
                 fulldaydata[i].avg_gain = avg_gain
@@ -86,19 +90,38 @@ def rsi(fulldaydata, period=14):
     return fulldaydata
 
 def slow_stochastic(fulldaydata, k_period=14, d_period=3):
-    for i in range(len(fulldaydata)):
+    # monotonic deques of (value, day index): lows increasing and highs decreasing,
+    # so the lowest low / highest high of the window is always at the front
+    lows = deque()
+    highs = deque()
+    k_sum = 0.0  # running sum of the last d_period slow_k values
+    for i, day in enumerate(fulldaydata):
+        while lows and lows[-1][0] >= day.low:
+            lows.pop()
+        lows.append((day.low, i))
+        while highs and highs[-1][0] <= day.high:
+            highs.pop()
+        highs.append((day.high, i))
+        if lows[0][1] <= i - k_period:
+            lows.popleft()
+        if highs[0][1] <= i - k_period:
+            highs.popleft()
+
         if i < k_period - 1:
-            fulldaydata[i].slow_k = 0
-            fulldaydata[i].slow_d = 0
+            day.slow_k = 0
+            day.slow_d = 0
+            continue
+        lowest_low = lows[0][0]
+        highest_high = highs[0][0]
+        day.slow_k = ((day.close - lowest_low) / (highest_high - lowest_low)) * 100 if highest_high != lowest_low else 0
+
+        k_sum += day.slow_k
+        if i >= k_period - 1 + d_period:
+            k_sum -= fulldaydata[i - d_period].slow_k
+        if i < k_period - 1 + d_period - 1:
+            day.slow_d = 0
         else:
-            lowest_low = min(fulldaydata[j].low for j in range(i - k_period + 1, i + 1))
-            highest_high = max(fulldaydata[j].high for j in range(i - k_period + 1, i + 1))
-            fulldaydata[i].slow_k = ((fulldaydata[i].close - lowest_low) / (highest_high - lowest_low)) * 100 if highest_high != lowest_low else 0
-
-            if i < k_period - 1 + d_period - 1:
-                fulldaydata[i].slow_d = 0
-            else:
-                fulldaydata[i].slow_d = sum(fulldaydata[j].slow_k for j in range(i - d_period + 1, i + 1)) / d_period
+            day.slow_d = k_sum / d_period
 
     return fulldaydata
 
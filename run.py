@@ -1,28 +1,45 @@
-import wx
+import argparse
 import threading
 import queue
 import sys
 from trade.api import IBApi
-from trade.main import MainFrame
+from trade.pacer import TokenBucket
+from trade.metrics import METRICS
+from config import create_c
 
-def main():
-    # Create queues for communication
-    gui_to_ib = queue.Queue()
-    ib_to_gui = queue.Queue()
-    
+def start_ib(gui_to_ib, ib_to_gui, args, c):
     # Create IBApi instance but don't start yet
-    ib_api = IBApi(gui_to_ib, ib_to_gui)
+    pacer = TokenBucket(c.ib.messages_per_second, c.ib.burst)
+    kwargs = dict(gui_to_ib=gui_to_ib, ib_to_gui=ib_to_gui, pacer=pacer, command_batch_size=c.ib.command_batch_size,
+                  forward_ticks=c.ib.forward_ticks, tick_interval=c.ib.tick_interval, host=c.ib.host, port=c.ib.port,
+                  client_id=c.ib.client_id if args.client_id is None else args.client_id)
+    if args.replay:
+        # no TWS, play back a recorded session instead
+        from trade.replay import ReplayApi
+        ib_api = ReplayApi(args.replay, speed=args.speed, **kwargs)
+    else:
+        ib_api = IBApi(**kwargs)
+    recorder = None
+    if args.record:
+        from trade.replay import record
+        recorder = record(ib_api, args.record)
 
     # Start IBApi in completely separate thread
     def run_ib_api():
         try:
             ib_api.start_api()
         except Exception as e:
-            print(f"IBApi error: {e}")
+            print(f"IBApi error: {e}", file=sys.stderr)
     
     ib_thread = threading.Thread(target=run_ib_api, daemon=True)
     ib_thread.start()
-    
+    return ib_api, recorder
+
+def run_gui(gui_to_ib, ib_to_gui):
+    # wx is only needed here, --headless runs without it
+    import wx
+    from trade.main import MainFrame
+
     app = wx.App(False)
     
     frame = MainFrame(None, "IB TWS Client", gui_to_ib, ib_to_gui)
@@ -40,5 +57,60 @@ def main():
     
     app.MainLoop()
 
+def run_headless(gui_to_ib, ib_to_gui, args, c):
+    from trade.headless import HeadlessView, open_sink
+
+    view = HeadlessView(gui_to_ib, ib_to_gui, open_sink(args.format, args.output), weeks=args.weeks)
+    try:
+        view.run(args.stocks or c.stocks, scan=args.scan, duration=args.duration, rescan=args.rescan)
+    except KeyboardInterrupt:
+        pass
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="IB TWS option chain viewer")
+    parser.add_argument("--headless", action="store_true", help="run without wx and write the results to stdout or --output")
+    parser.add_argument("--scan", action="store_true", help="headless: rank the puts of all stocks instead of loading the first one")
+    parser.add_argument("--stocks", nargs="+", help="headless: symbols to load, defaults to c.stocks")
+    parser.add_argument("--format", choices=["text", "csv", "json"], default="text", help="headless: output format")
+    parser.add_argument("--output", help="headless: file to write to instead of stdout")
+    parser.add_argument("--weeks", type=int, help="headless: weeks of expirations to load")
+    parser.add_argument("--rescan", type=float, help="headless, c.scan.mode snapshot: take fresh snapshots every this many seconds")
+    parser.add_argument("--duration", type=float, help="headless: stop after this many seconds")
+    parser.add_argument("--metrics", type=float, help="dump the metrics to stderr every this many seconds")
+    parser.add_argument("--client-id", type=int, help="TWS client id, defaults to c.ib.client_id; one per process on the same TWS")
+    parser.add_argument("--record", help="write the IB callbacks of this session to a file")
+    parser.add_argument("--replay", help="play back a --record file instead of connecting to TWS")
+    parser.add_argument("--no-cache", action="store_true", help="fetch all contract details from TWS, see c.cache")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time and 0 as fast as possible")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Create queues for communication
+    gui_to_ib = queue.Queue()
+    ib_to_gui = queue.Queue()
+    
+    c = create_c()
+    if args.no_cache or args.replay:
+        # a replay answers the requests of the recorded session, which had to make them all
+        from trade.cache import CACHE
+        CACHE.enabled = False
+
+    ib_api, recorder = start_ib(gui_to_ib, ib_to_gui, args, c)
+    dump_interval = args.metrics or c.metrics.dump_interval
+    if dump_interval:
+        METRICS.start_dump(dump_interval)
+
+    try:
+        if args.headless:
+            run_headless(gui_to_ib, ib_to_gui, args, c)
+        else:
+            run_gui(gui_to_ib, ib_to_gui)
+    finally:
+        ib_api.stop()
+        if recorder is not None:
+            recorder.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,59 @@
+import numpy as np
+from trade.history import TickHistory
+
+
+def record(history, rows, now):
+    rows = np.array(rows)
+    values = rows.astype(float)
+    history.record(rows, now, values, values, values, values, values)
+
+
+def assert_consistent(history):
+    """Every row maps to its own slot and every slot back to its row"""
+    mapped = np.flatnonzero(history.slots >= 0)
+    slots = history.slots[mapped]
+    assert len(set(slots.tolist())) == len(slots)
+    assert (history.owner[slots] == mapped).all()
+
+
+def test_takeover_never_shares_a_slot():
+    history = TickHistory(depth=8, max_contracts=4, capacity=4)
+    record(history, [0, 1], 1.0)
+    record(history, [10, 11, 12, 13, 14], 2.0)
+    assert_consistent(history)
+    assert history.slots[-1] == -1  # no stray write through owner -1
+    # the two free slots and the two quiet ones, the fifth row skips this sample
+    assert (history.slots[[0, 1]] == -1).all()
+    assert (history.slots[[10, 11, 12, 13]] >= 0).all()
+    assert history.slots[14] == -1
+    for row in (10, 11, 12, 13):
+        assert history.series(row)["bid"].tolist() == [float(row)]
+
+
+def test_takeover_after_clear():
+    history = TickHistory(depth=8, max_contracts=2, capacity=2)
+    record(history, [0, 1], 1.0)
+    history.clear()
+    record(history, [0, 1, 2], 2.0)
+    assert_consistent(history)
+    assert history.series(0)["time"].tolist() == [2.0]
+    assert history.series(1)["time"].tolist() == [2.0]
+    assert len(history.series(2)["time"]) == 0
+
+
+def test_quietest_contract_is_taken_over():
+    history = TickHistory(depth=4, max_contracts=2, capacity=2)
+    record(history, [0, 1], 1.0)
+    record(history, [1], 2.0)
+    record(history, [2], 3.0)
+    assert_consistent(history)
+    assert len(history.series(0)["time"]) == 0
+    assert history.series(1)["time"].tolist() == [1.0, 2.0]
+    assert history.series(2)["time"].tolist() == [3.0]
+
+
+def test_ring_keeps_the_last_depth_samples():
+    history = TickHistory(depth=3, max_contracts=2)
+    for t in range(5):
+        record(history, [7], float(t))
+    assert history.series(7)["time"].tolist() == [2.0, 3.0, 4.0]
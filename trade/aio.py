@@ -0,0 +1,202 @@
+import asyncio
+import datetime
+import threading
+from .api import IBApi
+from .pacer import TokenBucket
+from .registry import is_warning
+
+# closes a market data stream, see _Stream
+END = object()
+
+
+class IBError(Exception):
+    def __init__(self, errorCode, message, reqId=-1):
+        super().__init__(message)
+        self.errorCode = errorCode
+        self.reqId = reqId
+
+
+class LoopSink:
+    """
+    Stands in for IBApi.ib_to_gui: every event is handed to the asyncio loop
+    instead of a queue that something has to poll.
+    """
+
+    def __init__(self, loop, dispatch):
+        self.loop = loop
+        self.dispatch = dispatch
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self.dispatch, event)
+
+
+class _Collect:
+    """A request answered by a number of callbacks and then an End callback"""
+
+    def __init__(self, end):
+        self.end = end
+        self.items = []
+        self.future = asyncio.get_running_loop().create_future()
+
+    def feed(self, event):
+        if self.future.done():
+            return
+        if event.type == self.end:
+            self.future.set_result(self.items)
+        else:
+            self.items.append(event)
+
+    def fail(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class _Stream:
+    """Ticks of a market data line, ended by tickSnapshotEnd for snapshots"""
+
+    def __init__(self, end=None):
+        self.end = end
+        self.queue = asyncio.Queue()
+
+    def feed(self, event):
+        self.queue.put_nowait(END if event.type == self.end else event)
+
+    def fail(self, exc):
+        self.queue.put_nowait(exc)
+
+
+class AsyncIB:
+    """
+    asyncio façade over IBApi, next to the thread + queue setup of the gui.
+
+    Requests are coroutines resolved by reqId, e.g.
+
+        ib = AsyncIB()
+        await ib.connect()
+        chains = await asyncio.gather(*(ib.option_chain(s) for s in c.stocks))
+        async for tick in ib.market_data(conId, "OPT"):
+            ...
+
+    Commands use the same dicts as the Controller and are paced by the same
+    TokenBucket, awaited instead of slept on. Only the EClient reader runs in
+    a thread; its callbacks are handed to the loop with call_soon_threadsafe
+    (ticks arrive as IBApi's coalesced batches, so that is once per interval).
+    """
+
+    def __init__(self, api=None, pacer=None, reqId=1):
+        self.api = api if api is not None else IBApi(pacer=pacer or TokenBucket())
+        self.reqId = reqId
+        self.pending = {}  # reqId -> _Collect / _Stream
+        self.thread = None
+
+    async def connect(self, host="127.0.0.1", port=7496, clientId=0):
+        loop = asyncio.get_running_loop()
+        self.api.ib_to_gui = LoopSink(loop, self.dispatch)
+        await loop.run_in_executor(None, self.api.connect, host, port, clientId)
+        self.thread = threading.Thread(target=self.api.run, daemon=True)
+        self.thread.start()
+
+    def disconnect(self):
+        self.api.disconnect()
+
+    def dispatch(self, event):
+        """Runs on the loop for every event IBApi puts"""
+        if event.type == "tickBatch":
+            for tick in event.ticks:
+                self.route(tick)
+        else:
+            self.route(event)
+
+    def route(self, event):
+        request = self.pending.get(getattr(event, "reqId", -1))
+        if request is None:
+            return
+        if event.type == "error":
+            if not is_warning(event.errorCode):
+                request.fail(IBError(event.errorCode, event.data, event.reqId))
+            return
+        request.feed(event)
+
+    async def send(self, command):
+        """Pace and send a command dict, returns its reqId"""
+        if "reqId" not in command:
+            command["reqId"] = self.reqId
+            self.reqId += 1
+        await self.api.pacer.acquire_async()
+        self.api.execute(command)
+        return command["reqId"]
+
+    async def _collect(self, command, end):
+        reqId = command["reqId"] = self.reqId
+        self.reqId += 1
+        request = self.pending[reqId] = _Collect(end)
+        try:
+            await self.send(command)
+            return await request.future
+        finally:
+            del self.pending[reqId]
+
+    async def contract_details(self, stock=None, option=None):
+        """
+        ContractDetailsEvents of a stock symbol, or of an option dict as sent
+        by Controller.loadChain ({"symbol", "lastTradeDateOrContractMonth", "right", ...})
+        """
+        command = {"method_name": "reqContractDetails"}
+        if stock is not None:
+            command["stock"] = stock
+        else:
+            command["option"] = option
+        return await self._collect(command, "contractDetailsEnd")
+
+    async def sec_def_opt_params(self, symbol, conId):
+        """The securityDefinitionOptionParameter events of an underlying, one per exchange"""
+        command = {
+            "method_name": "reqSecDefOptParams",
+            "underlyingSymbol": symbol,
+            "futFopExchange": "",
+            "underlyingSecType": "STK",
+            "underlyingConId": conId,
+        }
+        return await self._collect(command, "securityDefinitionOptionParameterEnd")
+
+    async def market_data(self, conId, secType="STK", snapshot=False):
+        """
+        Ticks (tickPrice, tickOptionComputation, ...) of one market data line.
+        A snapshot ends by itself, a stream is cancelled when the loop leaves it.
+        """
+        reqId = self.reqId
+        self.reqId += 1
+        stream = self.pending[reqId] = _Stream(end="tickSnapshotEnd" if snapshot else None)
+        ended = False
+        try:
+            await self.send({"method_name": "reqMktData", "secType": secType, "conId": conId,
+                             "snapshot": snapshot, "reqId": reqId})
+            while True:
+                item = await stream.queue.get()
+                if item is END:
+                    ended = True
+                    return
+                if isinstance(item, Exception):
+                    ended = True
+                    raise item
+                yield item
+        finally:
+            del self.pending[reqId]
+            if not ended:
+                await self.send({"method_name": "cancelMktData", "reqId": reqId})
+
+    async def option_chain(self, symbol, max_weeks=2, right="P"):
+        """All contracts of symbol expiring within max_weeks, the expiries fetched concurrently"""
+        stock = await self.contract_details(stock=symbol)
+        params = await self.sec_def_opt_params(symbol, stock[0].conId)
+        today = datetime.date.today()
+        expirations = set()
+        for param in params:
+            for expiration in param.expirations:
+                weeks = (datetime.datetime.strptime(expiration, "%Y%m%d").date() - today).days // 7
+                if 0 < weeks <= max_weeks:
+                    expirations.add(expiration)
+        chains = await asyncio.gather(*(
+            self.contract_details(option={"symbol": symbol, "lastTradeDateOrContractMonth": expiration, "right": right})
+            for expiration in sorted(expirations)))
+        return [contract for chain in chains for contract in chain]
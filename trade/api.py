@@ -3,19 +3,49 @@ from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract, ContractDetails
 from ibapi.order import Order
 from ibapi.common import *
+from .pacer import TokenBucket
+from .metrics import METRICS
+from .events import event_type, CommandResultEvent, ErrorEvent, ContractDetailsEvent, TickBatchEvent
 import threading
+import queue
 import time
 import inspect
+import sys
+
+TICK_CALLBACKS = {"tickPrice", "tickSize", "tickString", "tickGeneric", "tickOptionComputation"}
 
 class IBApi(EWrapper, EClient):
-    def __init__(self, gui_to_ib=None, ib_to_gui=None):
+    # tick callbacks the controller uses, the others are dropped at the source
+    FORWARD_TICKS = {"tickPrice", "tickOptionComputation"}
+
+    def __init__(self, gui_to_ib=None, ib_to_gui=None, pacer=None, command_batch_size=50,
+                 forward_ticks=None, tick_interval=0.05, host="127.0.0.1", port=7496, client_id=0):
         EClient.__init__(self, self)
+        self.host = host
+        self.port = port
+        self.client_id = client_id  # unique per connection to the same TWS
         self.orders = []
         self.positions = []
         self.accounts = []
         self.account_summary = {}
         self.gui_to_ib = gui_to_ib
         self.ib_to_gui = ib_to_gui
+        # every outbound request is one message towards TWS, pace them all
+        self.pacer = pacer if pacer is not None else TokenBucket()
+        self.command_batch_size = command_batch_size
+        # latest tick per (callback, reqId, tickType), sent as one batch every tick_interval
+        self.forward_ticks = set(forward_ticks) if forward_ticks is not None else self.FORWARD_TICKS
+        self.tick_interval = tick_interval
+        self.tick_cache = {}
+        self.tick_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.ticks_received = METRICS.counter("api.ticks")
+        self.ticks_dropped = METRICS.counter("api.ticks_dropped")
+        self.tick_batches = METRICS.counter("api.tick_batches")
+        self.pacer_wait = METRICS.histogram("api.pacer_wait")
+        self.send_time = METRICS.histogram("api.send")
+        self.command_depth = METRICS.gauge("queue.gui_to_ib")
+        self.command_thread = None
         # Don't call start_api() in constructor
 
     def start_api(self):
@@ -26,29 +56,79 @@ class IBApi(EWrapper, EClient):
                 self.command_thread = threading.Thread(target=self._process_commands, daemon=True)
                 self.command_thread.start()
             
-            self.connect("127.0.0.1", 7496, 0)
+            self.connect(self.host, self.port, self.client_id)
             self.run()
         except Exception as e:
-            print(f"Error connecting to TWS: {e}")
+            print(f"Error connecting to TWS: {e}", file=sys.stderr)
+
+    def stop(self, timeout=5.0):
+        """Send the commands queued so far (the cancels of a shutdown), then stop the pump and disconnect"""
+        if self.command_thread is not None:
+            self.gui_to_ib.put(None)
+            self.command_thread.join(timeout)
+        self.disconnect()
 
     def nextValidId(self, orderId: int):
         pass
 
+    def msgLoopRec(self):
+        # called by EClient.run after every message from TWS
+        if time.monotonic() - self.last_flush >= self.tick_interval:
+            self.flush_ticks()
+
+    def msgLoopTmo(self):
+        # called by EClient.run when TWS was quiet for a while
+        self.flush_ticks()
+
+    def flush_ticks(self):
+        self.last_flush = time.monotonic()
+        with self.tick_lock:
+            if not self.tick_cache:
+                return
+            ticks = list(self.tick_cache.values())
+            self.tick_cache = {}
+        self.tick_batches.inc()
+        self.ib_to_gui.put(TickBatchEvent(ticks))
+
+    def _put(self, event):
+        """Send a non-tick callback, after the ticks that arrived before it"""
+        if self.tick_cache:
+            self.flush_ticks()
+        self.ib_to_gui.put(event)
+
     def _process_commands(self):
         """Process commands from the queue"""
-        print("Command processing thread started")
+        print("Command processing thread started", file=sys.stderr)
         while True:
+            # block until work arrives, then drain whatever else is already queued
+            batch = [self.gui_to_ib.get()]
             try:
-                if not self.gui_to_ib.empty():
-                    self.command = self.gui_to_ib.get(timeout=1)
-                    self._prepare_reqMktData()
-                    self._prepare_contractDetailsStock()
-                    self._prepare_contractDetailsOption()
-                    self._execute_command()
-                time.sleep(0.1)  # Small delay to prevent busy waiting
-            except Exception as e:
-                print(f"Command processing error: {e}")
-                continue
+                while len(batch) < self.command_batch_size:
+                    batch.append(self.gui_to_ib.get_nowait())
+            except queue.Empty:
+                pass
+            self.command_depth.set(self.gui_to_ib.qsize())
+            for command in batch:
+                if command is None:  # sentinel, stop the pump
+                    return
+                start = time.perf_counter()
+                self.pacer.acquire()
+                sent = time.perf_counter()
+                self.execute(command)
+                self.pacer_wait.observe(sent - start)
+                self.send_time.observe(time.perf_counter() - sent)
+
+    def execute(self, command):
+        """Turn one command dict into its EClient call and send it, the caller paces"""
+        try:
+            self.command = command
+            self._prepare_reqMktData()
+            self._prepare_reqRealTimeBars()
+            self._prepare_contractDetailsStock()
+            self._prepare_contractDetailsOption()
+            self._execute_command()
+        except Exception as e:
+            print(f"Command processing error: {e}", file=sys.stderr)
 
     def _prepare_contractDetailsOption(self):
         if self.command["method_name"] != "reqContractDetails":
@@ -94,6 +174,7 @@ class IBApi(EWrapper, EClient):
         #self.command is defined as: {"method_name": "reqMktData", "conId": 123123123123, "reqId": 1}
         #turn this into the signature for the reqMktData method
         # reqMktData(self, reqId: TickerId, contract: Contract, genericTickList: str, snapshot: bool, regulatorySnapshot: bool, mktDataOptions: ListOfTagValue)
+        snapshot = self.command.get("snapshot", False)
         if self.command["secType"] == "STK":
             contract = Contract()
             contract.conId = self.command["conId"]
@@ -115,13 +196,33 @@ class IBApi(EWrapper, EClient):
             contract.currency = "USD"
             self.command["contract"] = contract
             # Request Greeks and implied volatility data
-            self.command["genericTickList"] = "106"  # Model option, Impl Vol, Gamma, Theta, Delta
-        self.command["snapshot"] = False
+            # snapshots can't take generic ticks, they still deliver the option computations;
+            # without model ticks the greeks come from the bid/ask, see trade/greeks.py
+            model = self.command.pop("modelTicks", True)
+            self.command["genericTickList"] = "106" if model and not snapshot else ""  # Model option, Impl Vol, Gamma, Theta, Delta
+        self.command["snapshot"] = snapshot
         self.command["regulatorySnapshot"] = False
         self.command["mktDataOptions"] = []
         del self.command["secType"]
         del self.command["conId"]
 
+    def _prepare_reqRealTimeBars(self):
+        if self.command["method_name"] != "reqRealTimeBars":
+            return
+        #self.command is defined as: {"method_name": "reqRealTimeBars", "conId": 123123123123, "reqId": 1}
+        # reqRealTimeBars(self, reqId: int, contract: Contract, barSize: int, whatToShow: str, useRTH: bool, realTimeBarsOptions: list)
+        contract = Contract()
+        contract.conId = self.command["conId"]
+        contract.exchange = "SMART"
+        contract.secType = "STK"
+        contract.currency = "USD"
+        self.command["contract"] = contract
+        self.command["barSize"] = 5  # the only size IB offers
+        self.command["whatToShow"] = "TRADES"
+        self.command["useRTH"] = False
+        self.command["realTimeBarsOptions"] = []
+        del self.command["conId"]
+
     def _execute_command(self):
         """Execute IB API commands - pure generic dispatcher"""
         try:
@@ -133,37 +234,43 @@ class IBApi(EWrapper, EClient):
                 method = getattr(self, method_name)
                 #print(f"Executing: {method_name} {kwargs}")
                 result = method(**kwargs)
-                self.ib_to_gui.put({
-                    "type": "command_result", 
-                    "method": method_name,
-                    "result": result
-                })
+                self.ib_to_gui.put(CommandResultEvent(method_name, result))
                 
         except Exception as e:
-            print(f"Error executing command {self.command}: {e}")
+            print(f"Error executing command {self.command}: {e}", file=sys.stderr)
             if self.ib_to_gui:
-                self.ib_to_gui.put({"type": "error", "data": str(e)})
+                self.ib_to_gui.put(ErrorEvent(str(e), self.command.get("reqId", -1)))
     
     def auto_queue(func):
         """Decorator to automatically send callback data to GUI queue"""
-        def wrapper(self, *args, **kwargs):
-            # Call the original function first (for any custom logic)
-            result = func(self, *args, **kwargs)
-            func_name = func.__name__
-            if func_name == "error":
-                return
-            sig = inspect.signature(func)
-            bound = sig.bind(self, *args, **kwargs)
-            bound.apply_defaults()
-            # Remove 'self' from the arguments
-            arg_dict = {k: v for k, v in bound.arguments.items() if k != 'self'}
-            self.ib_to_gui.put({
-                "type": func_name,
-                "args": args,
-                "kwargs": arg_dict
-            })
-            
-            return result
+        func_name = func.__name__
+        if func_name == "error":
+            return func
+        # resolve the argument names once, when the class is built, instead of
+        # running inspect.signature + bind on every tick
+        params = list(inspect.signature(func).parameters.values())[1:]
+        defaults = tuple(p.default for p in params if p.default is not inspect.Parameter.empty)
+        event = event_type(func_name, tuple(p.name for p in params), defaults=defaults)
+
+        if func_name in TICK_CALLBACKS:
+            def wrapper(self, *args, **kwargs):
+                result = func(self, *args, **kwargs)
+                self.ticks_received.inc()
+                if func_name in self.forward_ticks:
+                    tick = event(*args, **kwargs)
+                    with self.tick_lock:
+                        self.tick_cache[(func_name, tick.reqId, tick.tickType)] = tick
+                else:
+                    self.ticks_dropped.inc()
+                return result
+        else:
+            def wrapper(self, *args, **kwargs):
+                # Call the original function first (for any custom logic)
+                result = func(self, *args, **kwargs)
+                self._put(event(*args, **kwargs))
+                return result
+        wrapper.__name__ = func_name
+        wrapper.event = event
         return wrapper
 
     @auto_queue
@@ -184,42 +291,37 @@ class IBApi(EWrapper, EClient):
     def tickGeneric(self, reqId: int, tickType: int, value: float):
         return
     
+    @auto_queue
+    def tickSnapshotEnd(self, reqId: int):
+        """Called when a snapshot request has delivered all its ticks"""
+        return
+
     @auto_queue
     def tickOptionComputation(self, reqId: int, tickType: int, tickAttrib: int,
                             impliedVol: float, delta: float, optPrice: float, 
                             pvDividend: float, gamma: float, vega: float, 
                             theta: float, undPrice: float):
         """Handle option Greeks and computed values"""
-        print(f"Option Computation. ReqId: {reqId}, TickType: {tickType}")
-        print(f"  Delta: {delta}, Gamma: {gamma}, Theta: {theta}, Vega: {vega}")
-        print(f"  ImpliedVol: {impliedVol}, OptPrice: {optPrice}, UndPrice: {undPrice}")
         return
     
     def contractDetails(self, reqId: int, contract: ContractDetails):
-        if contract.contract.secType == "STK":
-            kwargs = {
-                "reqId": reqId,
-                "secType": contract.contract.secType,
-                "conId": contract.contract.conId,
-            }
+        c = contract.contract
+        if c.secType == "STK":
+            self._put(ContractDetailsEvent(reqId, c.secType, c.conId))
         else:
-            kwargs = {
-                "reqId": reqId,
-                "secType": contract.contract.secType,
-                "conId": contract.contract.conId,
-                "strike": contract.contract.strike,
-                "right": contract.contract.right,
-                "lastTradeDateOrContractMonth": contract.contract.lastTradeDateOrContractMonth,
-            }
-        args = kwargs.values()
-
-
-        self.ib_to_gui.put({
-            "type": "contractDetails",
-            "reqId": reqId,
-            "args": args,
-            "kwargs": kwargs
-        })
+            self._put(ContractDetailsEvent(reqId, c.secType, c.conId,
+                                           c.strike, c.right, c.lastTradeDateOrContractMonth))
+
+    @auto_queue
+    def realtimeBar(self, reqId: int, time: int, open_: float, high: float, low: float, close: float,
+                    volume: int, wap: float, count: int):
+        """A 5 second bar of a reqRealTimeBars stream, time is its start"""
+        return
+
+    @auto_queue
+    def contractDetailsEnd(self, reqId: int):
+        """Called when all contracts of a reqContractDetails have been received"""
+        return
 
     @auto_queue
     def securityDefinitionOptionParameter(self, reqId: int, exchange: str, 
@@ -247,14 +349,13 @@ class IBApi(EWrapper, EClient):
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson = ""):
         if reqId == -1:
             return
-        if errorCode in [200, 201, 202]:  # Generic IB errors
-            return
-        print(f"ERROR {reqId} {errorCode} {errorString}")
+        if errorCode not in [200, 201, 202]:  # Generic IB errors, still end their request
+            print(f"ERROR {reqId} {errorCode} {errorString}", file=sys.stderr)
         if errorCode == 321 and reqId in [9001, 9002]:
-            print("Account validation error - this might be due to incorrect account name")
-            print(f"Available accounts: {self.accounts}")
-            # Send error to data queue so UI can display it
-            if self.data_queue:
-                self.data_queue.put({"type": "error", "data": f"Error {errorCode}: {errorString}"})
+            print("Account validation error - this might be due to incorrect account name", file=sys.stderr)
+            print(f"Available accounts: {self.accounts}", file=sys.stderr)
+        # Send error to data queue so the controller can act on the failed request
+        if self.ib_to_gui:
+            self._put(ErrorEvent(f"Error {errorCode}: {errorString}", reqId, errorCode))
 
 
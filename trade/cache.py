@@ -0,0 +1,134 @@
+import datetime
+import os
+import sqlite3
+import threading
+from config import create_c
+from .metrics import METRICS
+
+c = create_c()
+
+# bumped when the tables change, older files are emptied and recreated
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stocks (symbol TEXT PRIMARY KEY, conId INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS params (
+    symbol TEXT, day TEXT, expirations TEXT, strikes TEXT,
+    PRIMARY KEY (symbol, day));
+CREATE TABLE IF NOT EXISTS contracts (
+    symbol TEXT, expiry INTEGER, strike REAL, right TEXT, conId INTEGER NOT NULL,
+    PRIMARY KEY (symbol, expiry, strike, right, conId));
+CREATE TABLE IF NOT EXISTS chains (
+    symbol TEXT, expiry INTEGER, right TEXT,
+    PRIMARY KEY (symbol, expiry, right));
+"""
+
+
+class ContractCache:
+    """
+    Contract details kept on disk between sessions, in a sqlite file.
+
+    conIds never change for a listed contract, so a stock's conId and the
+    contracts of an expiry are kept until the expiry passed. A strike can
+    have several contracts (trading classes, adjusted deliverables), all
+    of them are kept, as the live chain request lists them all. A (symbol,
+    expiry, right) is only in "chains" once every one of its contracts was
+    received, so a half loaded chain is fetched again. The chain parameters
+    (expirations and strikes) can change from day to day and are kept per
+    day. Opened on first use; with enabled off every lookup is a miss and
+    nothing is written (e.g. for --replay, which expects the requests).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = path is not None
+        self.db = None
+        self.lock = threading.Lock()
+        self.hits = METRICS.counter("cache.hits")
+        self.misses = METRICS.counter("cache.misses")
+
+    def _open(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.db.executescript("DROP TABLE IF EXISTS stocks; DROP TABLE IF EXISTS params; "
+                                      "DROP TABLE IF EXISTS contracts; DROP TABLE IF EXISTS chains;")
+                self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.db.executescript(SCHEMA)
+            # expired contracts are of no use anymore
+            today = int(datetime.date.today().strftime("%Y%m%d"))
+            self.db.execute("DELETE FROM contracts WHERE expiry < ?", (today,))
+            self.db.execute("DELETE FROM chains WHERE expiry < ?", (today,))
+            self.db.execute("DELETE FROM params WHERE day < ?", (datetime.date.today().isoformat(),))
+            self.db.commit()
+        return self.db
+
+    def _lookup(self, sql, args):
+        if not self.enabled:
+            return []
+        with self.lock:
+            rows = self._open().execute(sql, args).fetchall()
+        if rows:
+            self.hits.inc()
+        else:
+            self.misses.inc()
+        return rows
+
+    def _write(self, sql, rows):
+        if not self.enabled:
+            return
+        with self.lock:
+            db = self._open()
+            db.executemany(sql, rows)
+            db.commit()
+
+    def stock(self, symbol):
+        """conId of the stock, None when not cached"""
+        rows = self._lookup("SELECT conId FROM stocks WHERE symbol = ?", (symbol,))
+        return rows[0][0] if rows else None
+
+    def put_stock(self, symbol, conId):
+        self._write("INSERT OR REPLACE INTO stocks VALUES (?, ?)", [(symbol, conId)])
+
+    def params(self, symbol):
+        """(expirations, strikes) of the stock's options as of today, None when not cached"""
+        rows = self._lookup("SELECT expirations, strikes FROM params WHERE symbol = ? AND day = ?",
+                            (symbol, datetime.date.today().isoformat()))
+        if not rows:
+            return None
+        expirations, strikes = rows[0]
+        return expirations.split(), [float(strike) for strike in strikes.split()]
+
+    def put_params(self, symbol, expirations, strikes):
+        self._write("INSERT OR REPLACE INTO params VALUES (?, ?, ?, ?)",
+                    [(symbol, datetime.date.today().isoformat(),
+                      " ".join(sorted(expirations)), " ".join(repr(float(strike)) for strike in sorted(strikes)))])
+
+    def chain(self, symbol, expiry, right):
+        """[(conId, strike)] of every contract of an expiry, None when not (completely) cached"""
+        expiry = int(expiry)
+        if not self._lookup("SELECT 1 FROM chains WHERE symbol = ? AND expiry = ? AND right = ?",
+                            (symbol, expiry, right)):
+            return None
+        with self.lock:
+            return self._open().execute(
+                "SELECT conId, strike FROM contracts WHERE symbol = ? AND expiry = ? AND right = ? ORDER BY strike",
+                (symbol, expiry, right)).fetchall()
+
+    def put_chain(self, symbol, expiry, right, contracts):
+        """Store [(conId, strike)], all contracts of the expiry"""
+        expiry = int(expiry)
+        self._write("INSERT OR REPLACE INTO contracts VALUES (?, ?, ?, ?, ?)",
+                    [(symbol, expiry, strike, right, conId) for conId, strike in contracts])
+        self._write("INSERT OR REPLACE INTO chains VALUES (?, ?, ?)", [(symbol, expiry, right)])
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# the cache every Controller uses, see c.cache
+CACHE = ContractCache(c.cache.path)
@@ -1,91 +1,247 @@
-from collections import OrderedDict
+from collections import deque
+import queue
 from ibapi.contract import Contract
+from config import create_c
+from .store import OptionStore
+from .subscriptions import SubscriptionManager
+from .registry import RequestRegistry, is_warning
+from .metrics import METRICS
+from .cache import CACHE
+from . import greeks
+from .ranking import Ranker
+from .history import TickHistory
+from .indicators import StreamingPowerX, SIGNALS
+import numpy as np
 import time
 import datetime
+import sys
+c = create_c()
+
+# reqIds of scan sessions start at multiples of this, see trade/scanner.py
+REQID_BLOCK = 1_000_000
+
+# only the latest of these per (reqId, tickType) matters, older ones in a batch are dropped
+COALESCED = {"tickPrice", "tickSize", "tickGeneric", "tickString", "tickOptionComputation"}
+IGNORED = {"tickSize", "tickGeneric", "tickString"}
+# tickPrice types of an option kept in the store
+OPTION_PRICES = {1: "bid", 2: "ask", 4: "lastPrice"}
 
 class Controller:
-    def __init__(self, mainframe):
-        self.mainframe = mainframe
-        self.reqId = 1
-        self.requests = OrderedDict()  # Maintain order of requests
+    def __init__(self, view, reqId=1, max_lines=None):
+        self.view = view  # see trade/view.py
+        self.reqId = reqId
+        # this controller's reqIds, up to the next REQID_BLOCK multiple where a scan session's start
+        self.reqIds = range(reqId, (reqId // REQID_BLOCK + 1) * REQID_BLOCK)
+        self.requests = RequestRegistry()  # open requests in order, finished ones leave
         self.conId = None
-        self.stats = {}
-
-    def process_incoming_data(self):
-        while not self.mainframe.ib_to_gui.empty():
-            
-            incoming_command = self.mainframe.ib_to_gui.get()
-
-            if incoming_command["type"] in ['command_result']:
-                return
-            try:
-                incoming_request_id = int(incoming_command["kwargs"]["reqId"])
-            except (KeyError, ValueError, TypeError):
-                print(f"Invalid or missing reqId in incoming command: {incoming_command}")
-            #print(f"looking for request id: {incoming_request_id} {self.requests}")
-            if incoming_request_id in self.requests:
-                command = self.requests[incoming_request_id]
-                command_type = incoming_command["type"]
-
-                if hasattr(self, f"handle_{command_type}"):
-                    handler = getattr(self, f"handle_{command_type}")
-                    handler(incoming_command)
+        self.stockprice = None
+        self.options = OptionStore()
+        self.ranker = Ranker()  # metrics and top candidates of self.options
+        self.history = TickHistory()  # quotes and greeks over time per row of self.options
+        self.dirty = set()  # grid rows touched since the last repaint
+        self.clear_grid = False
+        self.lines = SubscriptionManager(max_lines or c.ib.max_market_data_lines)  # option row -> reqMktData reqId
+        self.excluded = {}  # row -> stock price when it was dropped for its delta
+        self.snapshot_queue = deque()  # rows waiting for a snapshot
+        self.snapshots = {}  # reqId -> row of the snapshots in flight
+        self.snapshotted = set()  # rows queued or done
+        self.fetched = {}  # reqId of a chain request -> [(conId, strike)] received, for the cache
+        self.params = (set(), set())  # expirations, strikes of all exchanges, for the cache
+        self.window = None  # (low, high) strike of the streamed window
+        self.window_stale = False
+        self.greeks_price = None  # stock price of the last fillGreeks
+        self.unique_strikes = np.empty(0)
+        self.scanner = None
+        self.powerx = None  # StreamingPowerX over the stock's bars, see getStockBars
+        self.bar = None  # [bucket, high, low, close] of the bar being aggregated
+        self.backlog = deque()  # messages taken off the queue but not dispatched yet
+        # message type -> bound handler, built once instead of a getattr per message
+        self.handlers = {name[len("handle_"):]: getattr(self, name)
+                         for name in dir(self) if name.startswith("handle_")}
+        # hot path metrics, looked up once, see trade/metrics.py
+        self.handler_time = {name: METRICS.histogram(f"handler.{name}") for name in self.handlers}
+        self.frame_time = METRICS.histogram("controller.frame")
+        self.render_time = METRICS.histogram("render.grid")
+        self.queue_depth = METRICS.gauge("queue.ib_to_gui")
+        self.backlog_depth = METRICS.gauge("controller.backlog")
+        self.received = METRICS.counter("controller.messages")
+        self.coalesced = METRICS.counter("controller.coalesced")
+        self.sent = {}  # method_name -> its requests.<method> counter
+        self.stats_name = "controller"  # prefix of the gauges of reportStats
+        self.stats = {}  # gauge name -> gauge, see reportStats
+
+    def process_incoming_data(self, time_budget=None, max_messages=None):
+        """
+        Drain ib_to_gui within a per-frame budget. Superseded ticks in the batch
+        are coalesced, whatever is left when the time runs out waits in the backlog
+        for the next frame. Returns True when messages are left over.
+        """
+        time_budget = time_budget or c.gui.frame_budget
+        max_messages = max_messages or c.gui.max_messages
+        start = time.perf_counter()
+        deadline = start + time_budget
+        ib_to_gui = self.view.ib_to_gui
+        self.queue_depth.set(ib_to_gui.qsize())
+        batch = self.backlog
+        try:
+            while len(batch) < max_messages:
+                incoming_command = ib_to_gui.get_nowait()
+                if incoming_command.type == "tickBatch":
+                    batch.extend(incoming_command.ticks)
                 else:
-                    ignore_list = [
-                        "tickPrice",
-                        "tickSize",
-                        "tickGeneric",
-                        "tickString",
-                        "securityDefinitionOptionParameterEnd"
-                    ]
-                    if command_type in ignore_list:
-                        return
-                    print(f"No handler for method: {command_type}")
-            
+                    batch.append(incoming_command)
+        except queue.Empty:
+            pass
+        received = len(batch)
+        batch = self.coalesce(batch)
+        self.received.inc(received)
+        self.coalesced.inc(received - len(batch))
+        self.backlog = deque()
+        left = False
+        for i, incoming_command in enumerate(batch):
+            if i % 64 == 0 and i and time.perf_counter() > deadline:
+                self.backlog.extend(batch[i:])
+                left = True
+                break
+            if incoming_command.type == "command_result":
+                continue
+            if self.scanner is not None and getattr(incoming_command, "reqId", 0) >= REQID_BLOCK:
+                self.scanner.dispatch(incoming_command)
+                continue
+            self.dispatch(incoming_command)
+        self.frame_time.observe(time.perf_counter() - start)
+        self.backlog_depth.set(len(self.backlog))
+        self.reportStats()
+        return left or not ib_to_gui.empty()
+
+    def reportStats(self):
+        """
+        Once per frame: the request lifecycle counts of self.requests and the
+        market data line counts of self.lines as <stats_name>.requests.* and
+        <stats_name>.lines.* gauges, for the periodic metrics dump
+        """
+        for group, stats in (("requests", self.requests.stats()), ("lines", self.lines.stats())):
+            for key, value in stats.items():
+                name = f"{self.stats_name}.{group}.{key}"
+                gauge = self.stats.get(name)
+                if gauge is None:
+                    gauge = self.stats[name] = METRICS.gauge(name)
+                gauge.set(value)
+
+    @staticmethod
+    def coalesce(batch):
+        """Keep only the last tick per (type, reqId, tickType), at its own position"""
+        seen = set()
+        kept = []
+        for incoming_command in reversed(batch):
+            if incoming_command.type in COALESCED:
+                key = (incoming_command.type, incoming_command.reqId, incoming_command.tickType)
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(incoming_command)
+        kept.reverse()
+        return kept
+
+    def dispatch(self, incoming_command):
+        try:
+            incoming_request_id = int(incoming_command.reqId)
+        except (AttributeError, ValueError, TypeError):
+            print(f"Invalid or missing reqId in incoming command: {incoming_command}", file=sys.stderr)
+            return
+        #print(f"looking for request id: {incoming_request_id} {self.requests}")
+        if incoming_request_id in self.requests:
+            command_type = incoming_command.type
+            if command_type in COALESCED:
+                self.requests.streaming(incoming_request_id)
+
+            handler = self.handlers.get(command_type)
+            if handler is not None:
+                start = time.perf_counter()
+                handler(incoming_command)
+                self.handler_time[command_type].observe(time.perf_counter() - start)
+            elif command_type not in IGNORED:
+                print(f"No handler for method: {command_type}", file=sys.stderr)
+        else:
+            # ticks still in flight for a cancelled or finished request
+            self.requests.is_late(incoming_request_id)
+
+    def showPrice(self, text):
+        self.view.show_price(text)
+
+    def showSignal(self, text):
+        # scan sessions share the view, say whose signal it is
+        self.view.show_signal(self.stock, text)
+
+    def maxWeeks(self):
+        return self.view.max_weeks()
 
     def sendIbCommand(self, command):
         newcommand = command.copy()
         if "reqId" not in newcommand:
-            newcommand["reqId"] = self.reqId
-        self.mainframe.gui_to_ib.put(newcommand)
-        self.requests[self.reqId] = newcommand
-        self.reqId += 1
-        if self.stats.get(command["method_name"]) is None:
-            self.stats[command["method_name"]] = 0
-        self.stats[command["method_name"]] += 1
-        if self.reqId % 100 == 0:
-            print(self.stats)
+            # a new request, cancels refer to an existing one and get no entry
+            newcommand["reqId"] = self.nextReqId()
+            self.requests.add(newcommand["reqId"], newcommand)
+        self.view.gui_to_ib.put(newcommand)
+        method = command["method_name"]
+        counter = self.sent.get(method)
+        if counter is None:
+            counter = self.sent[method] = METRICS.counter(f"requests.{method}")
+        counter.inc()
+        return newcommand["reqId"]
 
 
+    def nextReqId(self):
+        """
+        The next reqId of self.reqIds no open request holds. At the end of the
+        block it wraps to the start, answers are routed by block and must never
+        reach another symbol's session.
+        """
+        reqId = self.reqId
+        while reqId not in self.reqIds or reqId in self.requests:
+            reqId = reqId + 1 if reqId in self.reqIds else self.reqIds.start
+        self.reqId = reqId + 1
+        return reqId
+
     def cancelStreams(self):
-        new_requests = OrderedDict()
-        cancel_commands = []
         for reqId, command in self.requests.items():
             if command["method_name"] == "reqMktData":
-                cancel_command = {
-                    "method_name": "cancelMktData",
-                    "reqId": reqId
-                }
-                cancel_commands.append(cancel_command)
-            else:
-                new_requests[reqId] = command
-        self.requests = new_requests
-        for cancel_command in cancel_commands:
-            self.sendIbCommand(cancel_command)
+                self.cancelMktData(reqId)
+            elif command["method_name"] == "reqRealTimeBars":
+                self.cancelRealTimeBars(reqId)
+        self.powerx = None
+        # the streams feeding the chain are gone, don't let updateWindow revive them
+        self.stockprice = None
+        self.lines.clear()
+        self.clearChain()
 
     def getStock(self, stock=""):
         #first cancel all other stock price streams
         #send command to ibapi to cancel all other streams
+        self.stopScan()
         self.cancelStreams()
         
         if stock != "":
             self.stock = stock
         else:
-            self.stock = self.mainframe.txt_stock.GetValue()
+            self.stock = self.view.selected_stock()
         if stock == "":
             return
         self.getContractDetails()
 
+    def scan(self, stocks):
+        """Load the chains of all stocks at once and rank their puts, see trade/scanner.py"""
+        from .scanner import Scanner
+        self.stopScan()
+        self.cancelStreams()
+        self.scanner = Scanner(self, stocks)
+        self.scanner.start()
+
+    def stopScan(self):
+        if self.scanner is not None:
+            self.scanner.stop()
+            self.scanner = None
+
     def getStockContractDict(self):
         contractDict = {
             "symbol": self.stock,
@@ -105,14 +261,38 @@ class Controller:
             "underlyingSecType": "STK",
             "underlyingConId": self.conId if self.conId is not None else 0
         }
-        self.sendIbCommand(command)
         self.strikes = []
         self.expirations = []
-        self.options = {}
+        self.clearChain()
+        params = CACHE.params(self.stock)
+        if params is not None:
+            # known today, straight to the chain
+            self.loadParams(*params)
+            return
+        self.params = (set(), set())
+        self.sendIbCommand(command)
+
+    def clearChain(self):
+        self.options.clear()
+        self.ranker.reset()
+        self.history.clear()
+        self.dirty = set()
+        self.clear_grid = True
+        self.lines.clear(pinned=False)
+        self.excluded = {}
+        self.snapshot_queue.clear()
+        self.snapshots = {}
+        self.snapshotted = set()
+        self.fetched = {}
+        self.window = None
 
 
 
     def getContractDetails(self):
+        conId = CACHE.stock(self.stock)
+        if conId is not None:
+            self.stockLoaded(conId)
+            return
         command = {
             "method_name": "reqContractDetails",
             "stock": self.stock
@@ -128,109 +308,407 @@ class Controller:
             "secType": "STK",
             "conId": self.conId,
         }
-        self.sendIbCommand(command)
+        # the stock price drives the strike window, never evict it
+        self.lines.add("stock", self.sendIbCommand(command), pinned=True)
 
     def cancelMktData(self, reqId):
-        command = self._serialize_command("cancelMktData", reqId=reqId)
+        command = {
+            "method_name": "cancelMktData",
+            "reqId": reqId
+        }
+        self.requests.cancel(reqId)
         self.sendIbCommand(command)
+
+    def subscribeOption(self, row):
+        # make room by cancelling the coldest option streams
+        while self.lines.full() and self.lines.coldest() is not None:
+            self.unsubscribeOption(self.lines.coldest())
+            self.lines.evicted += 1
+        if self.lines.full():
+            return
+        command = {
+            "method_name": "reqMktData",
+            "conId": int(self.options.get(row, "conId")),
+            "secType": "OPT",
+            "modelTicks": c.greeks.model_ticks,
+        }
+        # ticks come back under the market data reqId, point it at the option's row
+        reqId = self.sendIbCommand(command)
+        self.options.alias(reqId, row)
+        self.lines.add(row, reqId)
+
+    def unsubscribeOption(self, row):
+        reqId = self.lines.remove(row)
+        self.options.unalias(reqId)
+        self.cancelMktData(reqId)
+
+    def viewRow(self, row):
+        """The user looked at row, keep its stream warm"""
+        self.lines.touch(row)
+
+    def strikeWindow(self):
+        """Lowest and highest strike to stream around the stock price, per c.window"""
+        strikes = self.unique_strikes
+        price = self.stockprice
+        lo, hi = strikes[0], strikes[-1]
+        if c.window.pct is not None:
+            i = np.searchsorted(strikes, price * (1 - c.window.pct), "left")
+            j = np.searchsorted(strikes, price * (1 + c.window.pct), "right") - 1
+            lo, hi = max(lo, strikes[min(i, len(strikes) - 1)]), min(hi, strikes[max(j, 0)])
+        if c.window.strikes is not None:
+            i = np.searchsorted(strikes, price)
+            lo = max(lo, strikes[max(i - c.window.strikes, 0)])
+            hi = min(hi, strikes[min(i + c.window.strikes, len(strikes)) - 1])
+        return float(lo), float(hi)
+
+    def inDeltaBand(self, row):
+        delta = abs(self.options.get(row, "delta"))
+        if c.window.delta is None or not delta <= 1:  # unknown yet or IB's "not computed"
+            return True
+        return c.window.delta[0] <= delta <= c.window.delta[1]
+
+    def updateWindow(self):
+        """Slide the streamed strike window with the stock price, called once per frame"""
+        if self.stockprice is None or not len(self.options):
+            return
+        if self.window_stale:
+            self.unique_strikes = np.unique(self.options.view("strike"))
+        window = self.strikeWindow()
+        if window == self.window and not self.window_stale:
+            return
+        self.window = window
+        self.window_stale = False
+        strikes = self.options.view("strike")
+        inside = (strikes >= window[0]) & (strikes <= window[1])
+        if c.scan.mode == "snapshot":
+            rows = np.flatnonzero(inside)
+            self.queueSnapshots(rows[np.argsort(np.abs(strikes[rows] - self.stockprice), kind="stable")])
+            return
+        for row in self.lines:
+            if not inside[row]:
+                self.unsubscribeOption(row)
+        # never more than the line budget in one pass, the nearest strikes subscribed
+        # last so they are the warmest lines
+        rows = np.flatnonzero(inside)
+        rows = rows[np.argsort(np.abs(strikes[rows] - self.stockprice), kind="stable")]
+        budget = self.lines.max_lines - len(self.lines.pinned)
+        for row in rows[:budget][::-1].tolist():
+            if row in self.lines:
+                continue
+            if row in self.excluded:
+                if abs(self.stockprice - self.excluded[row]) < self.stockprice * c.window.recheck_pct:
+                    continue
+                del self.excluded[row]
+            self.subscribeOption(row)
     
 
-    def handle_contractDetails(self, incoming_command):
-        if incoming_command["kwargs"]["secType"] == "STK":
-
-            self.conId = incoming_command["kwargs"]["conId"]
-            self.requests[incoming_command["reqId"]]["conId"] = self.conId
-            self.getStockPrice()
-            self.reqSecDefOptParams()
-        elif incoming_command["kwargs"]["secType"] == "OPT":
-            reqId = incoming_command["kwargs"]["reqId"]
-            self.options[reqId] = {
-                "symbol": self.stock,
-                "lastTradeDateOrContractMonth": incoming_command["kwargs"].get("lastTradeDateOrContractMonth", ""),
-                "strike": int(incoming_command["kwargs"].get("strike", 0)),
-                "right": incoming_command["kwargs"].get("right", ""),
-            }
-            self.renderGrid()
+    def queueSnapshots(self, rows):
+        for row in rows.tolist():
+            if row not in self.snapshotted:
+                self.snapshotted.add(row)
+                self.snapshot_queue.append(row)
+        self.pumpSnapshots()
+
+    def pumpSnapshots(self):
+        """Keep a wave of snapshot requests in flight, the api paces the actual messages"""
+        while (self.snapshot_queue and len(self.snapshots) < c.scan.wave_size
+               and len(self.snapshots) + len(self.lines) < self.lines.max_lines):
+            row = self.snapshot_queue.popleft()
             command = {
                 "method_name": "reqMktData",
-                "conId": incoming_command["kwargs"]["conId"],
+                "conId": int(self.options.get(row, "conId")),
                 "secType": "OPT",
+                "snapshot": True,
             }
+            reqId = self.sendIbCommand(command)
+            self.options.alias(reqId, row)
+            self.snapshots[reqId] = row
 
-            self.sendIbCommand(command)
+    def rescan(self):
+        """Take fresh snapshots of every option in the window (of every scanned stock too)"""
+        self.snapshotted = set()
+        self.window = None
+        if self.scanner is not None:
+            self.scanner.rescan()
+
+    def finishSnapshot(self, reqId, errored=False):
+        if self.snapshots.pop(reqId, None) is None:
+            return
+        # the line is freed by TWS, late ticks for it are no longer routed
+        self.options.unalias(reqId)
+        if errored:
+            self.requests.fail(reqId)
+        else:
+            self.requests.complete(reqId)
+        self.pumpSnapshots()
+
+    def handle_tickSnapshotEnd(self, incoming_command):
+        self.finishSnapshot(incoming_command.reqId)
+
+    def handle_contractDetails(self, incoming_command):
+        if incoming_command.secType == "STK":
+            self.requests[incoming_command.reqId]["conId"] = incoming_command.conId
+            CACHE.put_stock(self.stock, incoming_command.conId)
+            self.stockLoaded(incoming_command.conId)
+        elif incoming_command.secType == "OPT":
+            # one request per expiry returns every strike, fan them out into the store
+            self.fetched.setdefault(incoming_command.reqId, []).append(
+                (incoming_command.conId, incoming_command.strike))
+            self.addOption(incoming_command.conId, int(incoming_command.lastTradeDateOrContractMonth or 0),
+                           incoming_command.strike, incoming_command.right)
+
+    def stockLoaded(self, conId):
+        """The stock's conId is known, from IB or the cache"""
+        self.conId = conId
+        self.getStockPrice()
+        if c.powerx.bars:
+            self.getStockBars()
+        self.reqSecDefOptParams()
+
+    def addOption(self, conId, expiry, strike, right):
+        if self.options.find(conId) is not None:
+            return
+        row = self.options.add(symbol=self.stock, conId=conId, expiry=expiry, strike=strike, right=right)
+        self.dirty.add(row)
+        # subscribed by updateWindow once it is known to be inside the strike window
+        self.window_stale = True
 
 
     def handle_tickPrice(self, incoming_command):
-        request = self.requests[incoming_command["kwargs"]["reqId"]]
+        request = self.requests[incoming_command.reqId]
         if "contract"  in request and request["contract"].secType == "STK":
-            if "price" in incoming_command["kwargs"]:
-                self.stockprice = incoming_command["kwargs"]["price"]
-                self.mainframe.txt_price.SetValue(f"{self.stockprice:.2f}")
-            return
-        if incoming_command["kwargs"].get("tickType") == 4:  # LAST price
-            reqId = incoming_command["kwargs"]["reqId"]
-            if reqId not in self.options:
-                self.options[reqId] = {}
-            self.options[reqId]["lastPrice"] = incoming_command["kwargs"]["price"]
-            self.renderGrid()
+            self.stockprice = incoming_command.price
+            self.showPrice(f"{self.stockprice:.2f}")
+            return
+        field = OPTION_PRICES.get(incoming_command.tickType)
+        if field is not None:
+            reqId = incoming_command.reqId
+            row = self.options.set(reqId, **{field: incoming_command.price})
+            self.renderGrid(reqId)
+            if row is not None:
+                self.lines.touch(row)
         
     def handle_tickOptionComputation(self, incoming_command):
-        reqId = incoming_command["kwargs"]["reqId"]
-        if reqId not in self.options:
-            self.options[reqId] = {}
-        self.options[reqId]["impliedVol"] = incoming_command["kwargs"].get("impliedVol", None)
-        self.options[reqId]["delta"] = incoming_command["kwargs"].get("delta", None)
-        self.options[reqId]["gamma"] = incoming_command["kwargs"].get("gamma", None)
-        self.options[reqId]["theta"] = incoming_command["kwargs"].get("theta", None)
-        self.options[reqId]["vega"] = incoming_command["kwargs"].get("vega", None)
-        self.options[reqId]["optPrice"] = incoming_command["kwargs"].get("optPrice", None)
-        self.mainframe.txt_price.SetValue(f"{self.stockprice:.2f} | Options: {len(self.options)}")
-        self.renderGrid()
+        reqId = incoming_command.reqId
+        self.options.set(reqId,
+                         impliedVol=incoming_command.impliedVol,
+                         delta=incoming_command.delta,
+                         gamma=incoming_command.gamma,
+                         theta=incoming_command.theta,
+                         vega=incoming_command.vega,
+                         optPrice=incoming_command.optPrice,
+                         localGreeks=False)
+        if self.stockprice is not None:
+            self.showPrice(f"{self.stockprice:.2f} | Options: {len(self.options)}")
+        self.renderGrid(reqId)
+        row = self.options.row(reqId)
+        if row not in self.lines:
+            return
+        if not self.inDeltaBand(row):
+            self.unsubscribeOption(row)
+            self.excluded[row] = self.stockprice
+            return
+        self.lines.touch(row)
 
-    def handle_securityDefinitionOptionParameter(self, incoming_command):
+    def handle_error(self, incoming_command):
+        reqId = incoming_command.reqId
+        if is_warning(incoming_command.errorCode):
+            return
+        if reqId in self.snapshots:
+            # a failed snapshot won't send tickSnapshotEnd, don't let it hold the wave
+            self.finishSnapshot(reqId, errored=True)
+            return
+        # a refused market data line; 101 means the max number of tickers was reached
+        if self.lines.reject(reqId, max_reached=incoming_command.errorCode == 101) is not None:
+            self.options.unalias(reqId)
+        self.requests.fail(reqId)
+
+    def getStockBars(self):
+        """Stream 5 second bars of the stock into a StreamingPowerX"""
+        if self.conId is None:
+            return
+        self.powerx = StreamingPowerX()
+        self.bar = None
+        command = {
+            "method_name": "reqRealTimeBars",
+            "conId": self.conId,
+        }
+        self.sendIbCommand(command)
+
+    def cancelRealTimeBars(self, reqId):
+        self.requests.cancel(reqId)
+        self.sendIbCommand({"method_name": "cancelRealTimeBars", "reqId": reqId})
+
+    def closeBar(self):
+        _, high, low, close = self.bar
+        self.bar = None
+        start = time.perf_counter()
+        signal = self.powerx.update(high, low, close)
+        METRICS.histogram("powerx.update").observe(time.perf_counter() - start)
+        if self.powerx.changed:
+            self.showSignal(SIGNALS[signal])
+
+    def handle_realtimeBar(self, incoming_command):
+        """5 second bars, aggregated into c.powerx.bar_seconds bars for the PowerX signal"""
+        self.requests.streaming(incoming_command.reqId)
+        if self.powerx is None:
+            return
+        bar_seconds = c.powerx.bar_seconds
+        bucket = incoming_command.time // bar_seconds
+        if self.bar is not None and self.bar[0] != bucket:
+            self.closeBar()  # its last 5 second bar never came (no trades)
+        if self.bar is None:
+            self.bar = [bucket, incoming_command.high, incoming_command.low, incoming_command.close]
+        else:
+            self.bar[1] = max(self.bar[1], incoming_command.high)
+            self.bar[2] = min(self.bar[2], incoming_command.low)
+            self.bar[3] = incoming_command.close
+        # the last 5 second bar of the bucket closes the bar right away
+        if (incoming_command.time + 5) % bar_seconds == 0:
+            self.closeBar()
+
+    def handle_contractDetailsEnd(self, incoming_command):
+        reqId = incoming_command.reqId
+        option = self.requests[reqId].get("option")
+        contracts = self.fetched.pop(reqId, None)
+        if option is not None and contracts:
+            # the whole expiry came in, later loads take it from the cache
+            CACHE.put_chain(option["symbol"], option["lastTradeDateOrContractMonth"], option["right"], contracts)
+        self.requests.complete(reqId)
+
+    def handle_securityDefinitionOptionParameterEnd(self, incoming_command):
+        expirations, strikes = self.params
+        CACHE.put_params(self.stock, expirations, strikes)
+        self.requests.complete(incoming_command.reqId)
+        self.loadParams(expirations, strikes)
+
+    def filterExpirations(self, expirations):
+        """The expirations 1 to maxWeeks() whole weeks out, sorted"""
         today = datetime.date.today()
-        for expiration in incoming_command["kwargs"].get("expirations", []):
-            max_weeks = int(self.mainframe.choice_weeks.GetStringSelection())
-            expiration_date = datetime.datetime.strptime(expiration, "%Y%m%d").date()
-            delta_weeks = (expiration_date - today).days // 7
-            if 0 < delta_weeks <= max_weeks:
-                self.expirations.append(expiration)
-        self.expirations = sorted(self.expirations)
-        self.strikes = sorted(incoming_command["kwargs"].get("strikes", []))
-        print(len(self.expirations) * len(self.strikes), "options found")
+        # YYYYMMDD strings sort like the dates, compare against the bounds instead of parsing each
+        first = (today + datetime.timedelta(days=7)).strftime("%Y%m%d")
+        last = (today + datetime.timedelta(days=7 * self.maxWeeks() + 6)).strftime("%Y%m%d")
+        return sorted(expiration for expiration in expirations if first <= expiration <= last)
+
+    def handle_securityDefinitionOptionParameter(self, incoming_command):
+        # one callback per exchange with mostly the same expirations and strikes,
+        # merged here and loaded once on securityDefinitionOptionParameterEnd
+        self.params[0].update(incoming_command.expirations)
+        self.params[1].update(incoming_command.strikes)
+
+    def loadParams(self, expirations, strikes):
+        self.expirations = self.filterExpirations(expirations)
+        self.strikes = sorted(strikes)
+        print(len(self.expirations) * len(self.strikes), "options found", file=sys.stderr)
+        self.loadChain()
 
+    def loadChain(self):
+        """One reqContractDetails per expiry, strike left blank: IB answers with every put of that expiry"""
         for expiration in self.expirations:
-            for strike in self.strikes:
-                option_type = "P"
-                command = {
-                    "method_name": "reqContractDetails",
-                    "option": {
-                        "symbol": self.stock,
-                        "lastTradeDateOrContractMonth": expiration,
-                        "strike": strike,
-                        "right": option_type,
-
-                    }
+            option_type = "P"
+            contracts = CACHE.chain(self.stock, expiration, option_type)
+            if contracts is not None:
+                for conId, strike in contracts:
+                    self.addOption(conId, int(expiration), strike, option_type)
+                continue
+            command = {
+                "method_name": "reqContractDetails",
+                "option": {
+                    "symbol": self.stock,
+                    "lastTradeDateOrContractMonth": expiration,
+                    "right": option_type,
                 }
-                self.sendIbCommand(command)
-
-    def renderGrid(self):
-        grid = self.mainframe.grid
-        grid.ClearGrid()
-        row = 0
-        for reqId, option in self.options.items():
-            if row >= grid.GetNumberRows():
-                grid.AppendRows(1)
-            grid.SetCellValue(row, 0, option.get("lastTradeDateOrContractMonth", ""))
-            grid.SetCellValue(row, 1, f"{option.get('strike', 0.0):.2f}")
-            grid.SetCellValue(row, 2, option.get("right", ""))
-            grid.SetCellValue(row, 3, f"{option.get('delta', 0.0):.4f}" if option.get('delta') is not None else "")
-            grid.SetCellValue(row, 4, f"{option.get('optPrice', 0.0):.2f}" if option.get('optPrice') is not None else "")
-            grid.SetCellValue(row, 5, f"{option.get('impliedVol', 0.0):.2%}" if option.get('impliedVol') is not None else "")
-            if self.stockprice and option.get('optPrice') is not None:
-                ppd = self.stockprice - option['strike'] + option['optPrice'] if option['right'] == 'P' else option['strike'] - self.stockprice + option['optPrice']
-                grid.SetCellValue(row, 6, f"{ppd:.2f}")
-                roi = (ppd / (option['strike'] * 100)) * 52 if option['strike'] > 0 else 0
-                grid.SetCellValue(row, 7, f"{roi:.2%}")
-            row += 1
-        grid.AutoSizeColumns()
\ No newline at end of file
+            }
+            self.sendIbCommand(command)
+
+    def fillGreeks(self):
+        """
+        Once per frame, before repaintGrid: blank IB's not-computed sentinels
+        and solve the greeks of the rows IB's model left empty from their
+        bid/ask mid (the last price without a quote), see trade/greeks.py.
+        Rows filled this way are solved again with every new quote until
+        IB's own numbers arrive.
+        """
+        if self.stockprice is None or not len(self.options):
+            return
+        moved = self.stockprice != self.greeks_price
+        if not self.dirty and not moved:
+            return
+        self.greeks_price = self.stockprice
+        store = self.options
+        dirty = np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty))
+        # sentinels only come with ticks, and those dirty their row
+        for name in greeks.Greeks._fields:
+            column = store.view(name)
+            column[dirty[np.abs(column[dirty]) >= greeks.NOT_COMPUTED]] = np.nan
+        if not c.greeks.fallback:
+            return
+        # a new stock price moves every fallback row, otherwise only the rows that ticked
+        rows = np.arange(len(store)) if moved else dirty
+        local = store.view("localGreeks")
+        rows = rows[local[rows] | np.isnan(store.view("delta")[rows])]
+        bid = store.view("bid")[rows]
+        ask = store.view("ask")[rows]
+        market = np.where((bid > 0) & (ask >= bid), 0.5 * (bid + ask), store.view("lastPrice")[rows])
+        rows, market = rows[market > 0], market[market > 0]
+        if not len(rows):
+            return
+        start = time.perf_counter()
+        result = greeks.solve(market, self.stockprice, store.view("strike")[rows],
+                              greeks.years_to_expiry(store.view("expiry")[rows]),
+                              store.view("right")[rows] == "P", c.greeks.rate)
+        solved = ~np.isnan(result.impliedVol)
+        rows = rows[solved]
+        changed = ~local[rows]
+        for name, values in zip(result._fields, result):
+            column = store.view(name)
+            old, new = column[rows], values[solved]
+            changed |= (old != new) & ~(np.isnan(old) & np.isnan(new))
+            column[rows] = new
+        local[rows] = True
+        # repaint (and rank and record) only the rows whose numbers moved
+        self.dirty.update(rows[changed].tolist())
+        METRICS.histogram("greeks.solve").observe(time.perf_counter() - start)
+
+    def renderGrid(self, reqId=None):
+        """Mark a row (or every row) for the next repaint, see repaintGrid"""
+        if reqId is None:
+            self.dirty.update(range(len(self.options)))
+            return
+        row = self.options.row(reqId)
+        if row is not None:
+            self.dirty.add(row)
+
+    def rankOptions(self):
+        """Re-rank the rows changed this frame (all of them on a new chain), see trade/ranking.py"""
+        self.ranker.update(self.options, self.stockprice, None if self.clear_grid else self.dirty)
+
+    def recordHistory(self):
+        """Sample the quotes and greeks of the rows that changed this frame, see trade/history.py"""
+        if not self.dirty:
+            return
+        store = self.options
+        rows = np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty))
+        bid, ask, last, impliedVol, delta = (store.view(name)[rows] for name in
+                                             ("bid", "ask", "lastPrice", "impliedVol", "delta"))
+        # new contract rows without any data yet have nothing to record
+        quoted = ~(np.isnan(bid) & np.isnan(ask) & np.isnan(last) & np.isnan(impliedVol))
+        self.history.record(rows[quoted], time.time(), bid[quoted], ask[quoted], last[quoted],
+                            impliedVol[quoted], delta[quoted])
+
+    def repaintGrid(self):
+        """Called once per frame from MainFrame.on_timer, the grid's table reads self.options directly"""
+        price = self.ranker.price
+        self.rankOptions()
+        self.recordHistory()
+        start = time.perf_counter()
+        # PPD and ROI of every row move with the stock price, quiet rows included
+        if self.clear_grid or self.ranker.price != price:
+            self.view.refresh_grid(None)
+        elif self.dirty:
+            self.view.refresh_grid(self.dirty)
+        else:
+            return
+        self.render_time.observe(time.perf_counter() - start)
+        self.dirty = set()
+        self.clear_grid = False
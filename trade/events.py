@@ -0,0 +1,28 @@
+from collections import namedtuple
+
+# every message on ib_to_gui is one of these records, keyed by its type name
+EVENT_TYPES = {}
+
+
+def event_type(name, fields, defaults=()):
+    """
+    Build (once) a compact record class for a callback.
+    Instances are plain tuples with named fields plus a class level `type`
+    attribute, so the GUI side can dispatch on event.type and read
+    event.reqId, event.price, ... without any per-message dict.
+    """
+    if name in EVENT_TYPES:
+        return EVENT_TYPES[name]
+    base = namedtuple(name, fields, defaults=defaults)
+    cls = type(name, (base,), {"__slots__": (), "type": name})
+    EVENT_TYPES[name] = cls
+    return cls
+
+
+CommandResultEvent = event_type("command_result", ("method", "result"))
+ErrorEvent = event_type("error", ("data", "reqId", "errorCode"), defaults=(-1, 0))
+ContractDetailsEvent = event_type("contractDetails",
+                                  ("reqId", "secType", "conId", "strike", "right", "lastTradeDateOrContractMonth"),
+                                  defaults=(0.0, "", ""))
+# the ticks cached on the IB reader thread since the last flush, see IBApi.flush_ticks
+TickBatchEvent = event_type("tickBatch", ("ticks",))
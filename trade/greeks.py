@@ -0,0 +1,146 @@
+"""
+Black-Scholes prices, greeks and implied vol over whole arrays of options.
+
+The local fallback for IB's model ticks (tickOptionComputation): one call
+solves the implied vol of every contract of a chain from its market price
+and returns the greeks in IB's units (theta per calendar day, vega per vol
+point). European exercise and no dividends, so for American puts and
+dividend payers it is an approximation until IB's numbers arrive.
+"""
+from collections import namedtuple
+import datetime
+import numpy as np
+import pytz
+
+Greeks = namedtuple("Greeks", ["impliedVol", "delta", "gamma", "theta", "vega", "optPrice"])
+
+# IB leaves fields it did not compute at DBL_MAX (1.79e308), anything this big is one of those
+NOT_COMPUTED = 1e300
+
+# expiries are at the close in New York
+CLOSE = datetime.time(16)
+EXCHANGE_TZ = pytz.timezone("America/New_York")
+YEAR = 365 * 24 * 3600
+
+# implied vols searched in this range
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+
+
+def clean(values):
+    """IB's not-computed sentinels (and None) as NaN, a float64 copy"""
+    values = np.array(values, dtype=np.float64)
+    values[np.abs(values) >= NOT_COMPUTED] = np.nan
+    return values
+
+
+def _erfc(x):
+    # Numerical Recipes' erfcc, fractional error below 1.2e-7 everywhere
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    r = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+            -0.82215223 + t * 0.17087277)))))))))
+    return np.where(x >= 0, r, 2.0 - r)
+
+
+def norm_cdf(x):
+    return 0.5 * _erfc(-x / np.sqrt(2.0))
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2.0 * np.pi)
+
+
+def years_to_expiry(expiry, now=None):
+    """Years from now until the close of each YYYYMMDD expiry (int array), 0 once expired"""
+    expiry = np.asarray(expiry)
+    now = now or datetime.datetime.now(EXCHANGE_TZ)
+    unique, inverse = np.unique(expiry, return_inverse=True)
+    years = np.zeros(len(unique))
+    for i, day in enumerate(unique.tolist()):
+        if day <= 0:
+            continue
+        close = EXCHANGE_TZ.localize(datetime.datetime.combine(
+            datetime.date(day // 10000, day // 100 % 100, day % 100), CLOSE))
+        years[i] = max((close - now).total_seconds(), 0.0) / YEAR
+    return years[inverse].reshape(expiry.shape)
+
+
+def _d1_d2(spot, strike, years, vol, rate):
+    root = vol * np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * years) / root
+    return d1, d1 - root
+
+
+def price(spot, strike, years, vol, put, rate=0.0):
+    """Black-Scholes price, put is a bool array (False for calls)"""
+    d1, d2 = _d1_d2(spot, strike, years, vol, rate)
+    discounted = strike * np.exp(-rate * years)
+    call = spot * norm_cdf(d1) - discounted * norm_cdf(d2)
+    # put-call parity
+    return np.where(put, call - spot + discounted, call)
+
+
+def implied_vol(market, spot, strike, years, put, rate=0.0, tol=1e-6, iterations=50):
+    """
+    Vol at which price() matches market, NaN where no vol does (a price
+    outside the no-arbitrage bounds, expired or missing inputs).
+
+    Newton steps on vega, with a bisection step whenever Newton would leave
+    the bracket of vols known to be too low / too high; all contracts move
+    in lockstep until the last one converged.
+    """
+    market, spot, strike, years = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64)
+                                                        for a in (market, spot, strike, years)))
+    put = np.broadcast_to(np.asarray(put, dtype=bool), market.shape)
+    discounted = strike * np.exp(-rate * years)
+    lower = np.where(put, np.maximum(discounted - spot, 0.0), np.maximum(spot - discounted, 0.0))
+    upper = np.where(put, discounted, spot)
+    vol = np.full(market.shape, np.nan)
+    ok = (years > 0) & (spot > 0) & (strike > 0) & (market > lower) & (market < upper)
+    if not ok.any():
+        return vol
+    market, spot, strike, years, put = market[ok], spot[ok], strike[ok], years[ok], put[ok]
+    # Brenner-Subrahmanyam's at the money approximation to start from
+    guess = np.clip(np.sqrt(2.0 * np.pi / years) * market / spot, 0.05, 3.0)
+    lo = np.full(guess.shape, MIN_VOL)
+    hi = np.full(guess.shape, MAX_VOL)
+    sqrt_years = np.sqrt(years)
+    for _ in range(iterations):
+        d1, _d2 = _d1_d2(spot, strike, years, guess, rate)
+        diff = price(spot, strike, years, guess, put, rate) - market
+        done = np.abs(diff) < tol
+        if done.all():
+            break
+        lo = np.where(diff < 0, guess, lo)
+        hi = np.where(diff > 0, guess, hi)
+        vega = spot * norm_pdf(d1) * sqrt_years
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = guess - diff / vega
+        step = np.where((step > lo) & (step < hi), step, 0.5 * (lo + hi))
+        guess = np.where(done, guess, step)
+    vol[ok] = guess
+    return vol
+
+
+def greeks(spot, strike, years, vol, put, rate=0.0):
+    """Greeks of every contract at vol, in IB's units, optPrice is the model price"""
+    d1, d2 = _d1_d2(spot, strike, years, vol, rate)
+    sqrt_years = np.sqrt(years)
+    pdf = norm_pdf(d1)
+    discounted = strike * np.exp(-rate * years)
+    delta = np.where(put, norm_cdf(d1) - 1.0, norm_cdf(d1))
+    gamma = pdf / (spot * vol * sqrt_years)
+    decay = -spot * pdf * vol / (2.0 * sqrt_years)
+    theta = np.where(put, decay + rate * discounted * norm_cdf(-d2), decay - rate * discounted * norm_cdf(d2))
+    vega = spot * pdf * sqrt_years
+    return Greeks(impliedVol=vol, delta=delta, gamma=gamma, theta=theta / 365.0, vega=vega / 100.0,
+                  optPrice=price(spot, strike, years, vol, put, rate))
+
+
+def solve(market, spot, strike, years, put, rate=0.0):
+    """Implied vol from the market price and the greeks at it, for a whole chain in one call"""
+    vol = implied_vol(market, spot, strike, years, put, rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return greeks(spot, strike, years, vol, put, rate)
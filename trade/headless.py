@@ -0,0 +1,171 @@
+import csv
+import json
+import math
+import sys
+import time
+from config import create_c
+from .controller import Controller
+from .view import View
+c = create_c()
+
+# fields of a written record, chain rows and ranked scan rows alike
+FIELDS = ["table", "symbol", "price", "expiry", "strike", "right", "delta", "optPrice", "impliedVol", "ppd", "roi"]
+
+
+def _value(value):
+    # numpy scalars to plain python, NaN (no data yet) to None
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class TextSink:
+    """One aligned line per record, for watching a scan in a terminal"""
+
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, records):
+        for r in records:
+            cells = [f"{r['table']:<5}", f"{r['symbol']:<6}", str(r["expiry"]), f"{r['strike']:>8.2f}", r["right"]]
+            for name, spec in [("delta", ".4f"), ("optPrice", ".2f"), ("impliedVol", ".2%"), ("ppd", ".2f"), ("roi", ".2%")]:
+                cells.append(f"{name} " + (format(r[name], spec) if r[name] is not None else "-"))
+            self.out.write("  ".join(cells) + "\n")
+        self.out.flush()
+
+
+class CsvSink:
+    def __init__(self, out):
+        self.out = out
+        self.writer = csv.DictWriter(out, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, records):
+        self.writer.writerows(records)
+        self.out.flush()
+
+
+class JsonSink:
+    """JSON lines, one object per record"""
+
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, records):
+        for r in records:
+            self.out.write(json.dumps(r) + "\n")
+        self.out.flush()
+
+
+SINKS = {"text": TextSink, "csv": CsvSink, "json": JsonSink}
+
+
+class HeadlessView(View):
+    """
+    Runs the Controller without wx: the same per-frame loop as MainFrame.on_timer,
+    with the changed chain rows and the ranked scan written to a sink every
+    c.headless.interval seconds instead of painted.
+    """
+
+    def __init__(self, gui_to_ib, ib_to_gui, sink, weeks=None):
+        self.gui_to_ib = gui_to_ib
+        self.ib_to_gui = ib_to_gui
+        self.sink = sink
+        self.weeks = weeks or c.headless.weeks
+        self.controller = Controller(self)
+        self.rows = set()  # chain rows changed since the last write
+        self.scan_changed = False
+        self.running = False
+
+    def show_signal(self, symbol, text):
+        # not a row of the sink, report it next to it
+        sys.stderr.write(f"{time.strftime('%H:%M:%S')} {symbol} PowerX {text}\n")
+
+    def max_weeks(self):
+        return self.weeks
+
+    def refresh_grid(self, rows):
+        if rows is None:
+            self.rows = set(range(len(self.controller.options)))  # a new chain, all of it changed
+        else:
+            self.rows.update(rows)
+
+    def refresh_scan(self):
+        self.scan_changed = True
+
+    def chain_records(self, rows):
+        controller = self.controller
+        store = controller.options
+        price = controller.stockprice
+        records = []
+        for row in sorted(rows):
+            if row >= len(store):
+                continue
+            record = {"table": "chain", "symbol": controller.stock, "price": price}
+            for name in FIELDS[3:-2]:
+                record[name] = _value(store.get(row, name))
+            record["ppd"] = _value(controller.ranker.value("ppd", row)) if price else None
+            record["roi"] = _value(controller.ranker.value("roi", row)) if price else None
+            records.append(record)
+        return records
+
+    def scan_records(self):
+        ranked = self.controller.scanner.ranked
+        return [{"table": "scan", "price": None, **{name: _value(ranked[name][i]) for name in ranked}}
+                for i in range(len(ranked["roi"]))]
+
+    def flush(self):
+        records = self.chain_records(self.rows)
+        self.rows = set()
+        if self.scan_changed and self.controller.scanner is not None:
+            records += self.scan_records()
+        self.scan_changed = False
+        if records:
+            self.sink.write(records)
+
+    def frame(self):
+        controller = self.controller
+        controller.process_incoming_data()
+        controller.updateWindow()
+        controller.fillGreeks()
+        controller.repaintGrid()
+        if controller.scanner is not None:
+            controller.scanner.update()
+
+    def run(self, stocks, scan=False, duration=None, rescan=None):
+        """
+        Load stocks[0] (or scan all of them) and stream results until stop() or
+        duration runs out, in snapshot mode taking fresh snapshots every rescan seconds
+        """
+        if scan:
+            self.controller.scan(stocks)
+        else:
+            self.controller.getStock(stocks[0])
+        self.running = True
+        started = last_write = last_rescan = time.monotonic()
+        try:
+            while self.running:
+                self.frame()
+                now = time.monotonic()
+                if now - last_write >= c.headless.interval:
+                    self.flush()
+                    last_write = now
+                if rescan and now - last_rescan >= rescan:
+                    self.controller.rescan()
+                    last_rescan = now
+                if duration is not None and now - started >= duration:
+                    break
+                time.sleep(c.headless.frame)
+        finally:
+            self.flush()
+            self.controller.stopScan()
+            self.controller.cancelStreams()
+
+    def stop(self):
+        self.running = False
+
+
+def open_sink(fmt, path=None):
+    out = open(path, "w", newline="") if path else sys.stdout
+    return SINKS[fmt](out)
@@ -0,0 +1,102 @@
+import numpy as np
+from config import create_c
+
+c = create_c()
+
+
+class TickHistory:
+    """
+    Intraday history of the streamed contracts in fixed-size ring buffers.
+
+    One preallocated float64 array of shape (fields, contracts, depth)
+    holds the last `depth` samples of every contract, so memory is bounded
+    by contracts * depth * 48 bytes whatever the tick rate. Contracts are
+    the OptionStore's rows; a row gets a slot on its first sample, slots
+    grow by doubling up to max_contracts, after that the slot written
+    longest ago is reused. record() takes whole arrays of rows at once.
+    """
+
+    FIELDS = ["time", "bid", "ask", "last", "impliedVol", "delta"]
+
+    def __init__(self, depth=None, max_contracts=None, capacity=16):
+        self.depth = depth or c.history.depth
+        self.max_contracts = max_contracts or c.history.contracts
+        self.capacity = min(capacity, self.max_contracts)
+        self.data = np.full((len(self.FIELDS), self.capacity, self.depth), np.nan)
+        self.count = np.zeros(self.capacity, dtype=np.int64)  # samples written per slot
+        self.owner = np.full(self.capacity, -1, dtype=np.int64)  # slot -> row
+        self.slots = np.full(256, -1, dtype=np.int64)  # row -> slot
+        self.used = 0
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def clear(self):
+        self.count[:] = 0
+        self.owner[:] = -1
+        self.slots[:] = -1
+        self.used = 0
+
+    def _grow(self):
+        old = self.capacity
+        self.capacity = min(2 * old, self.max_contracts)
+        data = np.full((len(self.FIELDS), self.capacity, self.depth), np.nan)
+        data[:, :old] = self.data
+        self.data = data
+        self.count = np.concatenate([self.count, np.zeros(self.capacity - old, dtype=np.int64)])
+        self.owner = np.concatenate([self.owner, np.full(self.capacity - old, -1, dtype=np.int64)])
+
+    def _assign(self, rows, busy):
+        """Give each of rows (new to the history) a slot, never taking one of the busy slots"""
+        while self.used + len(rows) > self.capacity and self.capacity < self.max_contracts:
+            self._grow()
+        free = min(len(rows), self.capacity - self.used)
+        slots = np.arange(self.used, self.used + free)
+        self.used += free
+        # the slots just handed out are as busy as those of the rows already in
+        busy = np.concatenate([busy, slots])
+        rest = rows[free:][:max(0, self.capacity - len(busy))]
+        if len(rest):
+            # full, take over the slots of the contracts that went quiet first
+            last = self.data[0, np.arange(self.capacity), (self.count - 1) % self.depth]
+            last[self.count == 0] = np.inf  # nothing written yet, whatever data holds is stale
+            last[busy] = np.inf
+            taken = np.argpartition(last, len(rest) - 1)[:len(rest)]
+            owners = self.owner[taken]
+            self.slots[owners[owners >= 0]] = -1
+            self.count[taken] = 0  # the old samples are past count, never read again
+            slots = np.concatenate([slots, taken])
+        rows = rows[:len(slots)]
+        self.owner[slots] = rows
+        self.slots[rows] = slots
+
+    def record(self, rows, now, bid, ask, last, impliedVol, delta):
+        """Append a sample at time now for each of rows (an int array), the values per row"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        if rows.max() >= len(self.slots):
+            slots = np.full(max(2 * len(self.slots), rows.max() + 1), -1, dtype=np.int64)
+            slots[:len(self.slots)] = self.slots
+            self.slots = slots
+        slots = self.slots[rows]
+        if (slots < 0).any():
+            self._assign(rows[slots < 0], slots[slots >= 0])
+            slots = self.slots[rows]
+        # more rows than slots in one go: the ones left without skip this sample
+        keep = slots >= 0
+        slots = slots[keep]
+        head = self.count[slots] % self.depth
+        self.data[:, slots, head] = [np.full(len(slots), now)] + [np.asarray(values)[keep] for values in
+                                                                 (bid, ask, last, impliedVol, delta)]
+        self.count[slots] += 1
+
+    def series(self, row):
+        """The samples of row oldest first, {field: array}, empty without history"""
+        slot = self.slots[row] if row < len(self.slots) else -1
+        if slot < 0:
+            return {name: np.empty(0) for name in self.FIELDS}
+        count = self.count[slot]
+        order = np.arange(max(0, count - self.depth), count) % self.depth
+        return {name: self.data[i, slot, order] for i, name in enumerate(self.FIELDS)}
@@ -0,0 +1,328 @@
+"""
+Array versions of the indicators in experiments/powerx.py.
+
+Every function takes float64 arrays with time on the last axis, so one
+call handles a single series of shape (days,) or a batch of symbols of
+shape (symbols, days). Results match the per-day loops of powerx.py,
+warm-up values included (0 until an indicator has enough history).
+"""
+from collections import deque, namedtuple
+import numpy as np
+
+Macd = namedtuple("Macd", ["ema_short", "ema_long", "macd", "signal_line", "histogram"])
+Stochastic = namedtuple("Stochastic", ["slow_k", "slow_d"])
+PowerX = namedtuple("PowerX", ["macd", "signal_line", "histogram", "rsi", "slow_k", "slow_d", "signal"])
+
+BUY, HOLD, SELL = 1, 0, -1
+SIGNALS = {BUY: "BUY", HOLD: "HOLD", SELL: "SELL"}
+
+# the EMA recursion is solved in blocks of this many days, see _ema
+_BLOCK = 64
+
+
+def _ema(x, k):
+    """
+    y[0] = x[0], y[t] = y[t-1] + k * (x[t] - y[t-1]) along the last axis.
+
+    Within a block the response to the inputs is one matmul with a lower
+    triangular matrix of k * (1-k)**(t-j); the blocks are then chained by
+    carrying each block's last value in, decayed by (1-k)**(t+1).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty_like(x)
+    if x.shape[-1] == 0:
+        return out
+    out[..., 0] = x[..., 0]
+    rest = x[..., 1:]
+    m = rest.shape[-1]
+    if m == 0:
+        return out
+    a = 1.0 - k
+    blocks = -(-m // _BLOCK)
+    padded = np.zeros(x.shape[:-1] + (blocks * _BLOCK,))
+    padded[..., :m] = rest * k
+    padded = padded.reshape(x.shape[:-1] + (blocks, _BLOCK))
+    t = np.arange(_BLOCK)
+    lag = t[:, None] - t[None, :]
+    weights = np.where(lag >= 0, a ** np.maximum(lag, 0), 0.0)
+    y = padded @ weights.T
+    # value carried into each block, chained over the block ends only
+    carry = np.empty(x.shape[:-1] + (blocks,))
+    prev = x[..., 0]
+    last = y[..., -1]
+    a_block = a ** _BLOCK
+    for b in range(blocks):
+        carry[..., b] = prev
+        prev = last[..., b] + a_block * prev
+    y += carry[..., None] * a ** (t + 1)
+    out[..., 1:] = y.reshape(x.shape[:-1] + (blocks * _BLOCK,))[..., :m]
+    return out
+
+
+def ema(x, period):
+    """Exponential moving average seeded with the first value, k = 2 / (period + 1)"""
+    return _ema(x, 2 / (period + 1))
+
+
+def macd(close, short=12, long=26, signal=9):
+    close = np.asarray(close, dtype=np.float64)
+    ema_short = ema(close, short)
+    ema_long = ema(close, long)
+    line = ema_short - ema_long
+    # the signal line starts as the macd itself once long + signal - 1 days are in
+    start = long + signal - 1
+    signal_line = np.zeros_like(line)
+    histogram = np.zeros_like(line)
+    if close.shape[-1] > start:
+        signal_line[..., start:] = ema(line[..., start:], signal)
+        histogram[..., start:] = line[..., start:] - signal_line[..., start:]
+    return Macd(ema_short, ema_long, line, signal_line, histogram)
+
+
+def rsi(close, period=14):
+    """Wilder RSI, 0 for the first period days and whenever there were no losses"""
+    close = np.asarray(close, dtype=np.float64)
+    result = np.zeros_like(close)
+    if close.shape[-1] <= period:
+        return result
+    change = np.diff(close, axis=-1)
+    gains = np.maximum(change, 0.0)
+    losses = np.maximum(-change, 0.0)
+    # simple average over the first period changes, Wilder's smoothing (k = 1/period) after that
+    seed_gain = gains[..., :period].mean(axis=-1)
+    seed_loss = losses[..., :period].mean(axis=-1)
+    gains = gains[..., period - 1:].copy()
+    losses = losses[..., period - 1:].copy()
+    gains[..., 0] = seed_gain
+    losses[..., 0] = seed_loss
+    avg_gain = _ema(gains, 1 / period)
+    avg_loss = _ema(losses, 1 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = np.where(avg_loss != 0, avg_gain / avg_loss, 0.0)
+    result[..., period:] = 100 - 100 / (1 + rs)
+    return result
+
+
+def _rolling(op, x, window, pad):
+    """
+    op (np.minimum / np.maximum) over the last window values, O(n) for any
+    window (van Herk / Gil-Werman): cut the series into blocks of window
+    values and take the running op forward and backward inside each block,
+    every window then spans the tail of one block and the head of the next.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    blocks = -(-n // window)
+    padded = np.full(x.shape[:-1] + (blocks * window,), pad)
+    padded[..., :n] = x
+    padded = padded.reshape(x.shape[:-1] + (blocks, window))
+    head = op.accumulate(padded, axis=-1).reshape(x.shape[:-1] + (-1,))
+    tail = op.accumulate(padded[..., ::-1], axis=-1)[..., ::-1].reshape(x.shape[:-1] + (-1,))
+    count = n - window + 1
+    return op(tail[..., :count], head[..., window - 1:window - 1 + count])
+
+
+def rolling_min(x, window):
+    """Minimum over the last window values, for every position from window - 1 on"""
+    return _rolling(np.minimum, x, window, np.inf)
+
+
+def rolling_max(x, window):
+    return _rolling(np.maximum, x, window, -np.inf)
+
+
+def rolling_mean(x, window):
+    """Mean over the last window values from a running sum, for every position from window - 1 on"""
+    total = np.cumsum(x, axis=-1)
+    total[..., window:] = total[..., window:] - total[..., :-window]
+    return total[..., window - 1:] / window
+
+
+def slow_stochastic(high, low, close, k_period=14, d_period=3):
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    slow_k = np.zeros_like(close)
+    slow_d = np.zeros_like(close)
+    if close.shape[-1] < k_period:
+        return Stochastic(slow_k, slow_d)
+    lowest = rolling_min(low, k_period)
+    highest = rolling_max(high, k_period)
+    span = highest - lowest
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = np.where(span != 0, (close[..., k_period - 1:] - lowest) / span * 100, 0.0)
+    slow_k[..., k_period - 1:] = k
+    if k.shape[-1] >= d_period:
+        slow_d[..., k_period + d_period - 2:] = rolling_mean(k, d_period)
+    return Stochastic(slow_k, slow_d)
+
+
+def stochastic_grid(high, low, close, k_periods, d_periods):
+    """
+    slow_stochastic for every (k, d) pair of a parameter sweep. The rolling
+    min/max is taken once per k and every d reuses one running sum, returns
+    slow_k of shape (len(k_periods),) + close.shape and slow_d of shape
+    (len(k_periods), len(d_periods)) + close.shape.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    slow_k = np.zeros((len(k_periods),) + close.shape)
+    slow_d = np.zeros((len(k_periods), len(d_periods)) + close.shape)
+    for i, k_period in enumerate(k_periods):
+        if close.shape[-1] < k_period:
+            continue
+        lowest = rolling_min(low, k_period)
+        highest = rolling_max(high, k_period)
+        span = highest - lowest
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = np.where(span != 0, (close[..., k_period - 1:] - lowest) / span * 100, 0.0)
+        slow_k[i, ..., k_period - 1:] = k
+        total = np.concatenate([np.zeros(k.shape[:-1] + (1,)), np.cumsum(k, axis=-1)], axis=-1)
+        for j, d_period in enumerate(d_periods):
+            if k.shape[-1] >= d_period:
+                slow_d[i, j, ..., k_period + d_period - 2:] = (total[..., d_period:] - total[..., :-d_period]) / d_period
+    return slow_k, slow_d
+
+
+def powerx_signal(macd_line, signal_line, rsi_values, slow_k):
+    """BUY (1) when all three are bullish, SELL (-1) when all three are bearish, else HOLD (0)"""
+    buy = (macd_line > signal_line) & (rsi_values > 50) & (slow_k > 50)
+    sell = (macd_line < signal_line) & (rsi_values < 50) & (slow_k < 50)
+    return np.select([buy, sell], [BUY, SELL], HOLD).astype(np.int8)
+
+
+def powerx(high, low, close):
+    """All PowerX indicators of one series or a (symbols, days) batch in one call"""
+    m = macd(close)
+    r = rsi(close)
+    s = slow_stochastic(high, low, close)
+    return PowerX(m.macd, m.signal_line, m.histogram, r, s.slow_k, s.slow_d,
+                  powerx_signal(m.macd, m.signal_line, r, s.slow_k))
+
+
+class StreamingMacd:
+    """macd() one bar at a time, O(1) state, same warm-up"""
+
+    def __init__(self, short=12, long=26, signal=9):
+        self.k_short = 2 / (short + 1)
+        self.k_long = 2 / (long + 1)
+        self.k_signal = 2 / (signal + 1)
+        self.start = long + signal - 1
+        self.count = 0
+        self.ema_short = self.ema_long = 0.0
+        self.macd = self.signal_line = self.histogram = 0.0
+
+    def update(self, close):
+        if self.count == 0:
+            self.ema_short = self.ema_long = close
+        else:
+            self.ema_short += (close - self.ema_short) * self.k_short
+            self.ema_long += (close - self.ema_long) * self.k_long
+            self.macd = self.ema_short - self.ema_long
+            if self.count == self.start:
+                self.signal_line = self.macd
+            elif self.count > self.start:
+                self.signal_line += (self.macd - self.signal_line) * self.k_signal
+                self.histogram = self.macd - self.signal_line
+        self.count += 1
+        return self.macd, self.signal_line, self.histogram
+
+
+class StreamingRsi:
+    """rsi() one bar at a time"""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.count = 0
+        self.prev = 0.0
+        self.avg_gain = self.avg_loss = 0.0  # sums until the period is full
+        self.value = 0.0
+
+    def update(self, close):
+        if self.count:
+            change = close - self.prev
+            gain = change if change > 0 else 0.0
+            loss = -change if change < 0 else 0.0
+            if self.count <= self.period:
+                self.avg_gain += gain
+                self.avg_loss += loss
+                if self.count == self.period:
+                    self.avg_gain /= self.period
+                    self.avg_loss /= self.period
+            else:
+                self.avg_gain = (gain + (self.period - 1) * self.avg_gain) / self.period
+                self.avg_loss = (loss + (self.period - 1) * self.avg_loss) / self.period
+            if self.count >= self.period:
+                rs = self.avg_gain / self.avg_loss if self.avg_loss != 0 else 0
+                self.value = 100 - 100 / (1 + rs)
+        self.prev = close
+        self.count += 1
+        return self.value
+
+
+class StreamingStochastic:
+    """slow_stochastic() one bar at a time: monotonic deques of the window's lows/highs, running %D sum"""
+
+    def __init__(self, k_period=14, d_period=3):
+        self.k_period = k_period
+        self.d_period = d_period
+        self.count = 0
+        self.lows = deque()  # (low, bar), increasing
+        self.highs = deque()  # (high, bar), decreasing
+        self.ks = deque()  # the last d_period slow_k values
+        self.k_sum = 0.0
+        self.slow_k = self.slow_d = 0.0
+
+    def update(self, high, low, close):
+        i = self.count
+        self.count += 1
+        while self.lows and self.lows[-1][0] >= low:
+            self.lows.pop()
+        self.lows.append((low, i))
+        while self.highs and self.highs[-1][0] <= high:
+            self.highs.pop()
+        self.highs.append((high, i))
+        if self.lows[0][1] <= i - self.k_period:
+            self.lows.popleft()
+        if self.highs[0][1] <= i - self.k_period:
+            self.highs.popleft()
+        if i < self.k_period - 1:
+            return self.slow_k, self.slow_d
+        lowest = self.lows[0][0]
+        highest = self.highs[0][0]
+        self.slow_k = (close - lowest) / (highest - lowest) * 100 if highest != lowest else 0.0
+        self.ks.append(self.slow_k)
+        self.k_sum += self.slow_k
+        if len(self.ks) > self.d_period:
+            self.k_sum -= self.ks.popleft()
+        if len(self.ks) == self.d_period:
+            self.slow_d = self.k_sum / self.d_period
+        return self.slow_k, self.slow_d
+
+
+class StreamingPowerX:
+    """
+    The PowerX signal updated per closed bar, e.g. from IBApi.realtimeBar.
+    update() returns the signal (BUY / HOLD / SELL), changed tells whether it
+    differs from the previous bar's.
+    """
+
+    def __init__(self):
+        self.macd = StreamingMacd()
+        self.rsi = StreamingRsi()
+        self.stochastic = StreamingStochastic()
+        self.signal = HOLD
+        self.changed = False
+
+    def update(self, high, low, close):
+        line, signal_line, _ = self.macd.update(close)
+        rsi_value = self.rsi.update(close)
+        slow_k, _ = self.stochastic.update(high, low, close)
+        if line > signal_line and rsi_value > 50 and slow_k > 50:
+            signal = BUY
+        elif line < signal_line and rsi_value < 50 and slow_k < 50:
+            signal = SELL
+        else:
+            signal = HOLD
+        self.changed = signal != self.signal
+        self.signal = signal
+        return signal
@@ -5,10 +5,124 @@ import queue
 from .api import IBApi
 from config import create_c
 from .controller import Controller
+from .view import View
 c=create_c()
 
 
-class MainFrame(wx.Frame):
+def _fmt(value, spec):
+    # NaN (no data yet) renders as an empty cell
+    return format(value, spec) if value == value else ""
+
+
+class VirtualTable(wx.grid.GridTableBase):
+    """
+    Read-only virtual table: nothing is stored as strings, cells are
+    formatted by COLUMNS only when wx paints them.
+    """
+
+    COLUMNS = []  # (label, formatter(table, row) -> str)
+
+    def __init__(self):
+        super().__init__()
+        self.rows = 0  # row count the grid currently knows about
+
+    def row_count(self):
+        """Rows of the source the table shows, every subclass overrides this"""
+        raise NotImplementedError
+
+    def GetNumberRows(self):
+        return self.rows
+
+    def GetNumberCols(self):
+        return len(self.COLUMNS)
+
+    def GetColLabelValue(self, col):
+        return self.COLUMNS[col][0]
+
+    def IsEmptyCell(self, row, col):
+        return row >= self.row_count()
+
+    def GetValue(self, row, col):
+        if row >= self.row_count():
+            return ""
+        return self.COLUMNS[col][1](self, row)
+
+    def SetValue(self, row, col, value):
+        pass  # read only
+
+    def sync_rows(self):
+        """Tell the grid about rows added to or removed from the source"""
+        rows = self.row_count()
+        grid = self.GetView()
+        if rows > self.rows:
+            msg = wx.grid.GridTableMessage(self, wx.grid.GRIDTABLE_NOTIFY_ROWS_APPENDED, rows - self.rows)
+            grid.ProcessTableMessage(msg)
+        elif rows < self.rows:
+            msg = wx.grid.GridTableMessage(self, wx.grid.GRIDTABLE_NOTIFY_ROWS_DELETED, rows, self.rows - rows)
+            grid.ProcessTableMessage(msg)
+        self.rows = rows
+
+
+class OptionTable(VirtualTable):
+    """The chain of the loaded stock, straight from the controller's OptionStore"""
+
+    COLUMNS = [
+        ("Expiration", lambda t, row: str(t.store.get(row, "expiry") or "")),
+        ("Strike", lambda t, row: _fmt(t.store.get(row, "strike"), ".2f")),
+        ("Type", lambda t, row: str(t.store.get(row, "right"))),
+        ("Delta", lambda t, row: _fmt(t.store.get(row, "delta"), ".4f")),
+        ("Mid", lambda t, row: _fmt(t.store.get(row, "optPrice"), ".2f")),
+        ("IV", lambda t, row: _fmt(t.store.get(row, "impliedVol"), ".2%")),
+        ("PPD", lambda t, row: _fmt(t.controller.ranker.value("ppd", row), ".2f") if t.price else ""),
+        ("ROI", lambda t, row: _fmt(t.controller.ranker.value("roi", row), ".2%") if t.price else ""),
+    ]
+
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+
+    @property
+    def store(self):
+        return self.controller.options
+
+    @property
+    def price(self):
+        return self.controller.stockprice
+
+    def row_count(self):
+        return len(self.controller.options)
+
+
+class RankingTable(VirtualTable):
+    """The best puts over all scanned stocks, see trade/scanner.py"""
+
+    COLUMNS = [
+        ("Symbol", lambda t, row: str(t.ranked["symbol"][row])),
+        ("Expiration", lambda t, row: str(t.ranked["expiry"][row])),
+        ("Strike", lambda t, row: _fmt(t.ranked["strike"][row], ".2f")),
+        ("Type", lambda t, row: str(t.ranked["right"][row])),
+        ("Delta", lambda t, row: _fmt(t.ranked["delta"][row], ".4f")),
+        ("Mid", lambda t, row: _fmt(t.ranked["optPrice"][row], ".2f")),
+        ("IV", lambda t, row: _fmt(t.ranked["impliedVol"][row], ".2%")),
+        ("PPD", lambda t, row: _fmt(t.ranked["ppd"][row], ".2f")),
+        ("ROI", lambda t, row: _fmt(t.ranked["roi"][row], ".2%")),
+    ]
+
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+
+    @property
+    def ranked(self):
+        return self.controller.scanner.ranked
+
+    def row_count(self):
+        if self.controller.scanner is None:
+            return 0
+        return len(self.ranked["roi"])
+
+
+class MainFrame(wx.Frame, View):
     def __init__(self, parent, title, gui_to_ib, ib_to_gui):
         super().__init__(parent, title=title, size=(900, 800))
         self.controller = Controller(self)
@@ -45,11 +159,19 @@ class MainFrame(wx.Frame):
         self.choice = wx.Choice(self.panel, choices=c.stocks)
         hbox1.Add(self.choice, flag=wx.RIGHT, border=8)
         self.btn_load = wx.Button(self.panel, label='Load')
-        hbox1.Add(self.btn_load)
+        hbox1.Add(self.btn_load, flag=wx.RIGHT, border=8)
+        self.btn_scan = wx.Button(self.panel, label='Scan all')
+        hbox1.Add(self.btn_scan, flag=wx.RIGHT, border=8)
+        # snapshots are taken once per option, this takes them all again
+        self.btn_rescan = wx.Button(self.panel, label='Rescan')
+        hbox1.Add(self.btn_rescan)
+        self.btn_rescan.Show(c.scan.mode == "snapshot")
         self.vbox.Add(hbox1, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.TOP, border=10)
         # Bind the dropdown selection event
         self.choice.Bind(wx.EVT_CHOICE, self.on_stock_selected)
         self.btn_load.Bind(wx.EVT_BUTTON, self.on_load)
+        self.btn_scan.Bind(wx.EVT_BUTTON, self.on_scan)
+        self.btn_rescan.Bind(wx.EVT_BUTTON, self.on_rescan)
 
         #add a dropdown for the number of weeks to show, default: 2 weeks, options: 1 to 10
         #give it some horizontal space with the previous widget and show a label "weeks"
@@ -66,19 +188,71 @@ class MainFrame(wx.Frame):
         hbox2.Add(lbl_price, flag=wx.RIGHT, border=8)
         self.txt_price = wx.TextCtrl(self.panel)
         hbox2.Add(self.txt_price, flag=wx.RIGHT, border=8)
+        lbl_signal = wx.StaticText(self.panel, label='PowerX:')
+        hbox2.Add(lbl_signal, flag=wx.RIGHT, border=8)
+        self.txt_signal = wx.TextCtrl(self.panel, style=wx.TE_READONLY)
+        hbox2.Add(self.txt_signal, flag=wx.RIGHT, border=8)
         self.vbox.Add(hbox2, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.TOP, border=10)
 
     def render_grid(self):
-        #i want to make an excel-like grid with 10 rows and 5 columns
-        self.grid = wx.grid.Grid(self.panel)  # Use wx.grid.Grid instead of wx.Grid
-        labels = ["Expiration", "Strike", "Type", "Delta", "Mid", "IV","PPD", "ROI"]
-        self.grid.CreateGrid(10, len(labels))
-        self.vbox.Add(self.grid, proportion=1, flag=wx.EXPAND|wx.ALL, border=10)
-        
-        for col, label in enumerate(labels):
-            self.grid.SetColLabelValue(col, label)
-        self.grid.AutoSizeColumns()
+        #excel-like grids, virtual: the tables read straight from the controller's option stores
+        #one tab with the chain of the loaded stock, one with the ranked scan over all stocks
+        self.notebook = wx.Notebook(self.panel)
+        self.grid = wx.grid.Grid(self.notebook)  # Use wx.grid.Grid instead of wx.Grid
+        self.table = OptionTable(self.controller)
+        self.grid.SetTable(self.table, takeOwnership=True)
+        self.grid.EnableEditing(False)
+        self.grid.Bind(wx.grid.EVT_GRID_SELECT_CELL, self.on_cell_selected)
+        self.size_columns(self.grid, self.table, ["20991231", "10000.00", "P", "-0.0000", "1000.00", "100.00%", "-1000.00", "-100.00%"])
+        self.notebook.AddPage(self.grid, "Chain")
+
+        self.scan_grid = wx.grid.Grid(self.notebook)
+        self.scan_table = RankingTable(self.controller)
+        self.scan_grid.SetTable(self.scan_table, takeOwnership=True)
+        self.scan_grid.EnableEditing(False)
+        self.size_columns(self.scan_grid, self.scan_table, ["WWWWW", "20991231", "10000.00", "P", "-0.0000", "1000.00", "100.00%", "-1000.00", "-100.00%"])
+        self.notebook.AddPage(self.scan_grid, "Scan")
+        self.vbox.Add(self.notebook, proportion=1, flag=wx.EXPAND|wx.ALL, border=10)
+
+    def size_columns(self, grid, table, samples):
+        # autosizing would format every row, size the columns once from typical values instead
+        for col, sample in enumerate(samples):
+            label = table.GetColLabelValue(col)
+            width = max(grid.GetTextExtent(sample)[0], grid.GetTextExtent(label)[0])
+            grid.SetColSize(col, width + 16)
 
+    def show_price(self, text):
+        self.txt_price.SetValue(text)
+
+    def show_signal(self, symbol, text):
+        # one field for the loaded stock and every scanned one, the latest change wins
+        self.txt_signal.SetValue(f"{symbol} {text}")
+
+    def max_weeks(self):
+        return int(self.choice_weeks.GetStringSelection())
+
+    def selected_stock(self):
+        return self.txt_stock.GetValue()
+
+    def refresh_grid(self, rows):
+        """Repaint the given rows, or the whole grid when rows is None"""
+        self.table.sync_rows()
+        if rows is None:
+            self.grid.ForceRefresh()
+            return
+        last_col = self.table.GetNumberCols() - 1
+        for row in rows:
+            self.grid.RefreshBlock(row, 0, row, last_col)
+
+    def refresh_scan(self):
+        # the ranking reorders on every update, repaint what is visible
+        self.scan_table.sync_rows()
+        self.scan_grid.ForceRefresh()
+
+
+    def on_cell_selected(self, event):
+        self.controller.viewRow(event.GetRow())
+        event.Skip()
 
     def on_stock_selected(self, event):
         selected_stock = self.choice.GetStringSelection()
@@ -90,9 +264,21 @@ class MainFrame(wx.Frame):
         if stock:
             self.controller.getStock(stock)
 
+    def on_scan(self, event):
+        print("on scan:", c.stocks)
+        self.controller.scan(c.stocks)
+        self.notebook.SetSelection(1)
+
+    def on_rescan(self, event):
+        self.controller.rescan()
+
     def on_timer(self, event):
-        """Check for incoming data from IB API"""
-        while not self.ib_to_gui.empty():
-            self.controller.process_incoming_data()
+        """Check for incoming data from IB API, within a time budget per frame"""
+        self.controller.process_incoming_data()
+        self.controller.updateWindow()
+        self.controller.fillGreeks()
+        self.controller.repaintGrid()
+        if self.controller.scanner is not None:
+            self.controller.scanner.update()
 
 
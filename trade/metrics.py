@@ -0,0 +1,129 @@
+from bisect import bisect_left
+import sys
+import threading
+import time
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+    Latencies in seconds, counted in buckets growing by sqrt(2) from 1us to
+    about 100s. observe() is a bisect and a few adds, percentiles are
+    read from the buckets (upper bound of the bucket, so within 41%).
+    """
+
+    BOUNDS = [1e-6 * 2 ** (i / 2) for i in range(54)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and latency histograms by name.
+
+    Hot paths look a metric up once and keep the object, updating it is a
+    plain attribute write. Each metric is meant to be written by one thread,
+    snapshot() and dump() may read from any.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.dumper = None
+
+    def counter(self, name):
+        metric = self.counters.get(name)
+        if metric is None:
+            metric = self.counters[name] = Counter()
+        return metric
+
+    def gauge(self, name):
+        metric = self.gauges.get(name)
+        if metric is None:
+            metric = self.gauges[name] = Gauge()
+        return metric
+
+    def histogram(self, name):
+        metric = self.histograms.get(name)
+        if metric is None:
+            metric = self.histograms[name] = Histogram()
+        return metric
+
+    def snapshot(self):
+        return {
+            "counters": {name: m.value for name, m in sorted(self.counters.items())},
+            "gauges": {name: m.value for name, m in sorted(self.gauges.items())},
+            "histograms": {name: m.snapshot() for name, m in sorted(self.histograms.items())},
+        }
+
+    def dump(self, out=None):
+        out = out or sys.stderr
+        snapshot = self.snapshot()
+        lines = [f"--- metrics {time.strftime('%H:%M:%S')}"]
+        lines += [f"{name} {value}" for name, value in snapshot["counters"].items()]
+        lines += [f"{name} {value}" for name, value in snapshot["gauges"].items()]
+        for name, h in snapshot["histograms"].items():
+            lines.append(f"{name} n={h['count']} mean={h['mean'] * 1e6:.1f}us p50={h['p50'] * 1e6:.1f}us "
+                         f"p99={h['p99'] * 1e6:.1f}us max={h['max'] * 1e6:.1f}us")
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+
+    def start_dump(self, interval, out=None):
+        """dump() every interval seconds from a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.dump(out)
+        self.dumper = threading.Thread(target=run, daemon=True)
+        self.dumper.start()
+
+
+# the registry the api, controller and views report to
+METRICS = MetricsRegistry()
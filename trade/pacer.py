@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to pace outbound IB messages.
+
+    rate is the refill speed in tokens per second, burst the bucket size.
+    In any one-second window at most rate + burst tokens are handed out,
+    so rate=45, burst=5 stays within IB's 50 messages per second limit.
+    """
+
+    def __init__(self, rate=45, burst=5):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _take(self, n):
+        """Take n tokens and return 0, or return the seconds until n are available"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    def try_acquire(self, n=1):
+        """Take n tokens if available, never blocks"""
+        return self._take(n) == 0.0
+
+    def acquire(self, n=1):
+        """Take n tokens, sleeping exactly as long as needed for the refill"""
+        while True:
+            wait = self._take(n)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, n=1):
+        """acquire() for coroutines, waits without blocking the event loop"""
+        while True:
+            wait = self._take(n)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
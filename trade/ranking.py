@@ -0,0 +1,157 @@
+import heapq
+import numpy as np
+from config import create_c
+from .greeks import years_to_expiry
+from .metrics import METRICS
+
+c = create_c()
+
+NONE = -np.inf  # score of a row that is no candidate
+
+
+class Ranker:
+    """
+    The top K put candidates of one OptionStore under the c.rank filters.
+
+    PPD, ROI, annualized yield and DTE are kept as arrays next to the
+    store, recomputed with numpy for the rows that changed in a frame (for
+    all rows when the stock price moved). The shortlist is a min-heap of
+    the K best scores: changed rows outside it that don't beat the heap's
+    smallest are skipped with one array compare, a member that got better
+    costs a heapify of K entries. Only a member that got worse can let a
+    row from outside in, that one case re-selects the top K from the score
+    array.
+    """
+
+    def __init__(self, top=None, key=None):
+        self.top = top or c.rank.top
+        self.key = key or c.rank.key  # "roi", "ppd" or "annual_yield"
+        self.columns = {name: np.empty(0) for name in ("ppd", "roi", "annual_yield", "dte", "score")}
+        self.heap = []  # (score, row) of the shortlist, worst first
+        self.members = {}  # row -> score
+        self.member = np.zeros(0, dtype=bool)  # row in members, by row
+        self.price = None
+        self.rebuilds = METRICS.counter("rank.rebuilds")
+
+    def reset(self):
+        self.columns = {name: np.empty(0) for name in self.columns}
+        self.heap = []
+        self.members = {}
+        self.member = np.zeros(0, dtype=bool)
+        self.price = None
+
+    def value(self, name, row):
+        """A metric of row, NaN until it was ranked"""
+        column = self.columns[name]
+        return column[row] if row < len(column) else np.nan
+
+    def _grow(self, size):
+        for name, column in self.columns.items():
+            if len(column) < size:
+                grown = np.full(max(size, 2 * len(column)), NONE if name == "score" else np.nan)
+                grown[:len(column)] = column
+                self.columns[name] = grown
+        if len(self.member) < size:
+            member = np.zeros(len(self.columns["score"]), dtype=bool)
+            member[:len(self.member)] = self.member
+            self.member = member
+
+    def _compute(self, store, stockprice, rows):
+        ppd, roi = store.metrics(stockprice, rows)
+        strike = store.view("strike")[rows]
+        premium = store.view("optPrice")[rows]
+        years = years_to_expiry(store.view("expiry")[rows])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            annual_yield = np.where((strike > 0) & (years > 0), premium / strike / years, np.nan)
+        dte = years * 365
+        columns = self.columns
+        columns["ppd"][rows] = ppd
+        columns["roi"][rows] = roi
+        columns["annual_yield"][rows] = annual_yield
+        columns["dte"][rows] = dte
+
+        keep = (store.view("right")[rows] == "P") & (premium > 0) & (dte > 0)
+        if c.rank.min_premium is not None:
+            keep &= premium >= c.rank.min_premium
+        if c.rank.max_dte is not None:
+            keep &= dte <= c.rank.max_dte
+        if c.rank.delta is not None:
+            delta = np.abs(store.view("delta")[rows])
+            keep &= (delta >= c.rank.delta[0]) & (delta <= c.rank.delta[1])
+        score = columns[self.key][rows]
+        keep &= ~np.isnan(score)
+        score = np.where(keep, score, NONE)
+        columns["score"][rows] = score
+        return score
+
+    def _rebuild(self, size):
+        score = self.columns["score"][:size]
+        rows = np.flatnonzero(score > NONE)
+        if len(rows) > self.top:
+            rows = rows[np.argpartition(-score[rows], self.top - 1)[:self.top]]
+        self.members = dict(zip(rows.tolist(), score[rows].tolist()))
+        self.member[:] = False
+        self.member[rows] = True
+        self.heap = [(s, row) for row, s in self.members.items()]
+        heapq.heapify(self.heap)
+        self.rebuilds.inc()
+
+    def update(self, store, stockprice, rows=None):
+        """Re-rank after the rows (all of them for None) changed, once per frame"""
+        size = len(store)
+        if stockprice is None or not size:
+            return
+        self._grow(size)
+        if rows is None or stockprice != self.price:
+            # every ppd/roi moves with the stock price
+            self.price = stockprice
+            self._compute(store, stockprice, np.arange(size))
+            self._rebuild(size)
+            return
+        rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        if not len(rows):
+            return
+        before = self.columns["score"][rows]
+        scores = self._compute(store, stockprice, rows)
+        # only members that changed and rows that beat the current shortlist need a look
+        inside = self.member[rows]
+        threshold = self.heap[0][0] if len(self.members) == self.top else NONE
+        look = (inside & (scores != before)) | (~inside & (scores > threshold))
+        rows, scores = rows[look], scores[look]
+        stale = False  # heap order broken by members that got better
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            old = self.members.get(row)
+            if old is not None:
+                if score == old:
+                    continue
+                if score < old and len(self.members) == self.top:
+                    self._rebuild(size)  # a row outside may beat it now
+                    return
+                if score == NONE:
+                    del self.members[row]
+                    self.member[row] = False
+                else:
+                    self.members[row] = score
+                stale = True
+            elif score > NONE:
+                if stale:
+                    self.heap = [(s, r) for r, s in self.members.items()]
+                    heapq.heapify(self.heap)
+                    stale = False
+                if len(self.members) < self.top:
+                    self.members[row] = score
+                    self.member[row] = True
+                    heapq.heappush(self.heap, (score, row))
+                elif score > self.heap[0][0]:
+                    _, evicted = heapq.heapreplace(self.heap, (score, row))
+                    del self.members[evicted]
+                    self.member[evicted] = False
+                    self.members[row] = score
+                    self.member[row] = True
+        if stale:
+            self.heap = [(s, r) for r, s in self.members.items()]
+            heapq.heapify(self.heap)
+
+    def shortlist(self):
+        """[(score, row)] of the candidates, best first"""
+        return sorted(((score, row) for row, score in self.members.items()), reverse=True)
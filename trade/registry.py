@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import time
+from .metrics import METRICS
+
+PENDING = "pending"
+STREAMING = "streaming"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+ERRORED = "errored"
+
+
+def is_warning(errorCode):
+    """IB reports these through error() but the request carries on"""
+    return 2100 <= errorCode < 2200 or errorCode in (399, 10090, 10167)
+
+
+class RequestRegistry:
+    """
+    The Controller's open requests and their lifecycle.
+
+    A request is pending until its first answer, streaming while a market
+    data line delivers ticks, and leaves the registry once it is completed
+    (contractDetailsEnd, securityDefinitionOptionParameterEnd,
+    tickSnapshotEnd), cancelled or errored. Finished reqIds are kept in a
+    bounded tombstone ring so late ticks can be recognised and dropped.
+    """
+
+    def __init__(self, tombstones=1024):
+        self.commands = {}  # reqId -> command dict
+        self.states = {}  # reqId -> PENDING / STREAMING
+        self.sent = {}  # reqId -> perf_counter when sent, until answered
+        self.tombstones = OrderedDict()  # reqId -> final state, oldest first
+        self.max_tombstones = tombstones
+        self.finished = {COMPLETED: 0, CANCELLED: 0, ERRORED: 0}
+        self.late = 0
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __contains__(self, reqId):
+        return reqId in self.commands
+
+    def __getitem__(self, reqId):
+        return self.commands[reqId]
+
+    def get(self, reqId, default=None):
+        return self.commands.get(reqId, default)
+
+    def items(self):
+        return list(self.commands.items())
+
+    def add(self, reqId, command):
+        self.commands[reqId] = command
+        self.states[reqId] = PENDING
+        self.sent[reqId] = time.perf_counter()
+
+    def _answered(self, reqId):
+        # round trip per IB method: until the first tick of a stream, the End of a request
+        sent = self.sent.pop(reqId, None)
+        if sent is not None:
+            METRICS.histogram(f"rtt.{self.commands[reqId]['method_name']}").observe(time.perf_counter() - sent)
+
+    def streaming(self, reqId):
+        if self.states.get(reqId) == PENDING:
+            self.states[reqId] = STREAMING
+            self._answered(reqId)
+
+    def state(self, reqId):
+        return self.states.get(reqId) or self.tombstones.get(reqId)
+
+    def _finish(self, reqId, state):
+        if state == COMPLETED and reqId in self.commands:
+            self._answered(reqId)
+        self.sent.pop(reqId, None)
+        if self.commands.pop(reqId, None) is None:
+            return False
+        del self.states[reqId]
+        self.finished[state] += 1
+        self.tombstones[reqId] = state
+        if len(self.tombstones) > self.max_tombstones:
+            self.tombstones.popitem(last=False)
+        return True
+
+    def complete(self, reqId):
+        return self._finish(reqId, COMPLETED)
+
+    def cancel(self, reqId):
+        return self._finish(reqId, CANCELLED)
+
+    def fail(self, reqId):
+        return self._finish(reqId, ERRORED)
+
+    def is_late(self, reqId):
+        """reqId already finished, count the message that still arrived for it"""
+        if reqId in self.tombstones:
+            self.late += 1
+            return True
+        return False
+
+    def stats(self):
+        live = {PENDING: 0, STREAMING: 0}
+        for state in self.states.values():
+            live[state] += 1
+        return {"live": len(self.commands), **live, **self.finished, "late": self.late}
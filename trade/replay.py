@@ -0,0 +1,149 @@
+"""
+Record the callback stream of a TWS session and play it back without TWS.
+
+A recording is a gzip file of pickled (seconds since start, callback, args)
+records. ReplayApi is an IBApi that never connects: start_api() calls the
+recorded callbacks on itself at the recorded pace, N times faster, or as
+fast as possible, so the whole queue -> controller -> grid path runs
+offline. Requests sent meanwhile go nowhere, but each recorded answer
+waits until its reqId was requested. The Controller hands out reqIds in
+the same order as long as the same stock is loaded, so the recorded
+answers line up with the replayed requests.
+"""
+import gzip
+import pickle
+import threading
+import time
+from ibapi.contract import ContractDetails
+from .api import IBApi
+
+RECORDED = [
+    "contractDetails", "contractDetailsEnd",
+    "securityDefinitionOptionParameter", "securityDefinitionOptionParameterEnd",
+    "tickPrice", "tickSize", "tickString", "tickGeneric", "tickOptionComputation", "tickSnapshotEnd",
+    "realtimeBar",
+    "error",
+]
+
+# fields of a contract kept in a recording, all IBApi.contractDetails reads
+CONTRACT_FIELDS = ["symbol", "secType", "conId", "strike", "right", "lastTradeDateOrContractMonth"]
+
+
+def _pack(name, args):
+    # keep recordings small and free of ibapi objects
+    if name == "contractDetails":
+        reqId, details = args[:2]
+        return reqId, tuple(getattr(details.contract, field) for field in CONTRACT_FIELDS)
+    if name == "tickPrice":
+        return args[:3] + (None,)  # the TickAttrib is not used
+    return args
+
+
+def _unpack(name, args):
+    if name == "contractDetails":
+        reqId, fields = args
+        details = ContractDetails()
+        for field, value in zip(CONTRACT_FIELDS, fields):
+            setattr(details.contract, field, value)
+        return reqId, details
+    return args
+
+
+class Recorder:
+    """Writes every RECORDED callback of an IBApi to path, see record()"""
+
+    def __init__(self, path):
+        self.file = gzip.open(path, "wb")
+        self.lock = threading.Lock()  # error() can come from the command thread
+        self.start = time.monotonic()
+        self.count = 0
+
+    def write(self, name, args):
+        record = (time.monotonic() - self.start, name, _pack(name, args))
+        with self.lock:
+            if self.file.closed:
+                return
+            pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def record(api, path):
+    """Start recording the callbacks of api to path, returns the Recorder"""
+    recorder = Recorder(path)
+    for name in RECORDED:
+        callback = getattr(api, name)
+
+        def wrapper(*args, _name=name, _callback=callback):
+            recorder.write(_name, args)
+            return _callback(*args)
+        # EReader's decoder calls self.wrapper.<callback>, the instance attribute wins
+        setattr(api, name, wrapper)
+    return recorder
+
+
+def read_records(path):
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                t, name, args = pickle.load(f)
+            except EOFError:
+                return
+            yield t, name, _unpack(name, args)
+
+
+class ReplayApi(IBApi):
+    """
+    IBApi fed from a recording instead of TWS. speed 1 replays in real time,
+    N replays N times faster and 0 (or None) as fast as possible.
+    """
+
+    def __init__(self, path, speed=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.speed = speed
+        self.replayed = 0
+        self.done = threading.Event()
+        self.requested = set()  # reqIds of the commands that came through
+        self.request_seen = threading.Condition()
+
+    def start_api(self):
+        if self.gui_to_ib:
+            # commands are still taken off the queue, they just reach no TWS
+            self.command_thread = threading.Thread(target=self._process_commands, daemon=True)
+            self.command_thread.start()
+        self.replay()
+
+    def _execute_command(self):
+        # nothing to send the prepared command to, the recording holds the answers
+        with self.request_seen:
+            self.requested.add(self.command.get("reqId"))
+            self.request_seen.notify_all()
+
+    def wait_for_request(self, reqId, timeout=1.0):
+        """
+        Like TWS, answer a request only once it was made, or the replay outruns
+        the controller. Gives up after timeout in case the session diverged.
+        """
+        self.flush_ticks()  # the controller may need the cached ticks to make the request
+        with self.request_seen:
+            self.request_seen.wait_for(lambda: reqId in self.requested, timeout)
+
+    def replay(self):
+        start = time.monotonic()
+        for t, name, args in read_records(self.path):
+            if self.speed:
+                wait = start + t / self.speed - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            if self.gui_to_ib and args and isinstance(args[0], int) and args[0] >= 0 \
+                    and args[0] not in self.requested:
+                self.wait_for_request(args[0])
+            getattr(self, name)(*args)
+            self.replayed += 1
+            self.msgLoopRec()  # as EClient.run does after every message
+        self.msgLoopTmo()
+        self.done.set()
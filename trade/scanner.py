@@ -0,0 +1,100 @@
+import heapq
+import time
+import numpy as np
+from config import create_c
+from .controller import Controller, REQID_BLOCK
+from .metrics import METRICS
+
+c = create_c()
+
+# columns of the ranked table, in display order
+RANK_FIELDS = ["symbol", "expiry", "strike", "right", "delta", "optPrice", "impliedVol", "ppd", "roi"]
+
+
+class SymbolSession(Controller):
+    """
+    Controller for one symbol of a scan. It shares the queues (and so the
+    IBApi pacer) with the main Controller, owns its own reqId block and
+    share of the market data lines, and has no widgets of its own.
+    """
+
+    def __init__(self, scanner, stock, reqId, max_lines):
+        super().__init__(scanner.view, reqId=reqId, max_lines=max_lines)
+        self.scanner = None  # sessions never scan themselves
+        self.owner = scanner
+        self.stock = stock
+        self.stats_name = f"scan.{stock}"
+
+    def showPrice(self, text):
+        pass
+
+    def repaintGrid(self):
+        # no grid, the scanner merges the shortlists of all sessions instead
+        self.rankOptions()
+        self.recordHistory()
+        self.dirty = set()
+        self.clear_grid = False
+
+
+class Scanner:
+    """
+    Loads the option chains of several stocks concurrently and keeps one
+    table of the best puts across all of them, merged from the shortlists
+    of the sessions' Rankers (ranked by c.rank.key).
+    """
+
+    def __init__(self, controller, stocks):
+        self.controller = controller
+        self.view = controller.view
+        max_lines = max(2, c.ib.max_market_data_lines // max(1, len(stocks)))
+        self.sessions = [SymbolSession(self, stock, (i + 1) * REQID_BLOCK, max_lines)
+                         for i, stock in enumerate(stocks)]
+        self.ranked = {name: np.empty(0) for name in RANK_FIELDS}
+
+    def start(self):
+        for session in self.sessions:
+            session.getContractDetails()
+
+    def stop(self):
+        for session in self.sessions:
+            session.cancelStreams()
+
+    def rescan(self):
+        for session in self.sessions:
+            session.rescan()
+
+    def dispatch(self, incoming_command):
+        index = incoming_command.reqId // REQID_BLOCK - 1
+        if index < len(self.sessions):
+            self.sessions[index].dispatch(incoming_command)
+
+    def update(self):
+        """Once per frame: slide the windows and re-rank when any option changed"""
+        changed = False
+        for session in self.sessions:
+            session.reportStats()
+            session.updateWindow()
+            session.fillGreeks()
+            changed = changed or bool(session.dirty)
+            price = session.ranker.price
+            session.repaintGrid()
+            # a stock tick dirties no row but moves every ppd/roi of the session
+            changed = changed or session.ranker.price != price
+        if changed:
+            start = time.perf_counter()
+            self.rank()
+            self.view.refresh_scan()
+            METRICS.histogram("render.scan").observe(time.perf_counter() - start)
+
+    def rank(self, top=None):
+        top = top or c.scan.top
+        best = heapq.nlargest(top, ((score, i, row) for i, session in enumerate(self.sessions)
+                                    for score, row in session.ranker.shortlist()))
+        ranked = {name: [] for name in RANK_FIELDS}
+        for _, i, row in best:
+            session = self.sessions[i]
+            for name in RANK_FIELDS[:-2]:
+                ranked[name].append(session.options.get(row, name))
+            ranked["ppd"].append(session.ranker.value("ppd", row))
+            ranked["roi"].append(session.ranker.value("roi", row))
+        self.ranked = {name: np.array(values) for name, values in ranked.items()}
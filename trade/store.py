@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class OptionStore:
+    """
+    Columnar, array-backed store of option contracts, one row per contract.
+
+    Every field lives in its own preallocated numpy array that grows by
+    doubling. Rows are found by conId or by the reqId of the request feeding
+    them (the reqMktData stream), see alias. Missing float values are NaN.
+    """
+
+    COLUMNS = {
+        "symbol": ("U12", ""),
+        "conId": (np.int64, 0),
+        "expiry": (np.int32, 0),  # YYYYMMDD
+        "strike": (np.float64, np.nan),
+        "right": ("U1", ""),
+        "delta": (np.float64, np.nan),
+        "gamma": (np.float64, np.nan),
+        "theta": (np.float64, np.nan),
+        "vega": (np.float64, np.nan),
+        "impliedVol": (np.float64, np.nan),
+        "optPrice": (np.float64, np.nan),
+        "lastPrice": (np.float64, np.nan),
+        "bid": (np.float64, np.nan),
+        "ask": (np.float64, np.nan),
+        "localGreeks": (np.bool_, False),  # the greeks above came from trade/greeks.py, not IB
+    }
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.columns = {name: np.full(capacity, fill, dtype=dtype)
+                        for name, (dtype, fill) in self.COLUMNS.items()}
+        self.size = 0
+        self.index = {}  # reqId -> row
+        self.conIds = {}  # conId -> row
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, reqId):
+        return reqId in self.index
+
+    def _grow(self):
+        old = self.capacity
+        self.capacity *= 2
+        for name, (dtype, fill) in self.COLUMNS.items():
+            column = np.full(self.capacity, fill, dtype=dtype)
+            column[:old] = self.columns[name]
+            self.columns[name] = column
+
+    def add(self, reqId=None, **fields):
+        """Append a contract row, optionally indexed by reqId, and return its row number"""
+        if self.size == self.capacity:
+            self._grow()
+        row = self.size
+        self.size += 1
+        if reqId is not None:
+            self.index[reqId] = row
+        if "conId" in fields:
+            self.conIds[fields["conId"]] = row
+        for name, value in fields.items():
+            self.columns[name][row] = value
+        return row
+
+    def alias(self, reqId, row):
+        """Route data for another request (e.g. the market data stream) to row"""
+        self.index[reqId] = row
+
+    def unalias(self, reqId):
+        self.index.pop(reqId, None)
+
+    def row(self, reqId):
+        return self.index.get(reqId)
+
+    def find(self, conId):
+        return self.conIds.get(conId)
+
+    def set(self, reqId, **fields):
+        """Update the fields of the row behind reqId, returns the row or None"""
+        row = self.index.get(reqId)
+        if row is None:
+            return None
+        for name, value in fields.items():
+            self.columns[name][row] = value
+        return row
+
+    def get(self, row, name):
+        return self.columns[name][row]
+
+    def view(self, name):
+        """The filled part of a column, no copy"""
+        return self.columns[name][:self.size]
+
+    def clear(self):
+        for name, (dtype, fill) in self.COLUMNS.items():
+            self.columns[name][:self.size] = fill
+        self.size = 0
+        self.index = {}
+        self.conIds = {}
+
+    def ppd(self, row, stockprice):
+        strike = self.columns["strike"][row]
+        optPrice = self.columns["optPrice"][row]
+        if self.columns["right"][row] == "P":
+            return stockprice - strike + optPrice
+        return strike - stockprice + optPrice
+
+    def roi(self, row, stockprice):
+        strike = self.columns["strike"][row]
+        if not strike > 0:
+            return 0.0
+        return (self.ppd(row, stockprice) / (strike * 100)) * 52
+
+    def metrics(self, stockprice, rows=None):
+        """ppd and roi of every row (or of rows) at once, same formulas as ppd()/roi()"""
+        rows = slice(None) if rows is None else rows
+        strike = self.view("strike")[rows]
+        optPrice = self.view("optPrice")[rows]
+        ppd = np.where(self.view("right")[rows] == "P",
+                       stockprice - strike + optPrice,
+                       strike - stockprice + optPrice)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            roi = np.where(strike > 0, ppd / (strike * 100) * 52, 0.0)
+        return ppd, roi
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+
+class SubscriptionManager:
+    """
+    Bookkeeping of the streaming market data lines, kept under IB's limit.
+
+    Lines are held in LRU order (coldest first); touch() a key whenever its
+    data is viewed or a useful tick arrives. The Controller sends the actual
+    reqMktData/cancelMktData commands and asks coldest() what to evict once
+    full(). Pinned lines (the stock price) are never evicted.
+    """
+
+    def __init__(self, max_lines=100):
+        self.max_lines = max_lines
+        self.lines = OrderedDict()  # key -> reqId, coldest first
+        self.pinned = {}  # key -> reqId
+        self.keys = {}  # reqId -> key
+        self.evicted = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.lines) + len(self.pinned)
+
+    def __contains__(self, key):
+        return key in self.lines or key in self.pinned
+
+    def __iter__(self):
+        return iter(list(self.lines))
+
+    def full(self):
+        return len(self) >= self.max_lines
+
+    def add(self, key, reqId, pinned=False):
+        if pinned:
+            self.pinned[key] = reqId
+        else:
+            self.lines[key] = reqId
+        self.keys[reqId] = key
+
+    def touch(self, key):
+        if key in self.lines:
+            self.lines.move_to_end(key)
+
+    def coldest(self):
+        return next(iter(self.lines), None)
+
+    def remove(self, key):
+        """Forget the line for key and return its reqId"""
+        reqId = self.lines.pop(key, None)
+        if reqId is None:
+            reqId = self.pinned.pop(key)
+        del self.keys[reqId]
+        return reqId
+
+    def reject(self, reqId, max_reached=False):
+        """TWS refused the line for reqId, returns its key (None if unknown)"""
+        key = self.keys.get(reqId)
+        if key is None:
+            return None
+        self.remove(key)
+        self.rejected += 1
+        if max_reached:
+            # the account allows fewer lines than configured, stay below what TWS accepted
+            self.max_lines = max(1, len(self))
+        return key
+
+    def clear(self, pinned=True):
+        """Forget all lines, keeping the pinned ones when pinned=False"""
+        self.lines.clear()
+        if pinned:
+            self.pinned.clear()
+        self.keys = {reqId: key for key, reqId in self.pinned.items()}
+
+    def stats(self):
+        return {
+            "active": len(self),
+            "max_lines": self.max_lines,
+            "evicted": self.evicted,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,35 @@
+from config import create_c
+c = create_c()
+
+
+class View:
+    """
+    What the Controller needs from whatever shows its results: the two queues
+    to the IBApi thread and a few callbacks. MainFrame (trade/main.py) is the
+    wx implementation, HeadlessView (trade/headless.py) writes to stdout/CSV/JSON.
+    """
+
+    gui_to_ib = None
+    ib_to_gui = None
+
+    def show_price(self, text):
+        pass
+
+    def show_signal(self, symbol, text):
+        """The PowerX signal of symbol's bars changed (BUY / HOLD / SELL)"""
+        pass
+
+    def max_weeks(self):
+        """Expirations further out than this many weeks are not loaded, c.headless.weeks unless overridden"""
+        return c.headless.weeks
+
+    def selected_stock(self):
+        return ""
+
+    def refresh_grid(self, rows):
+        """Chain rows changed, None means the whole chain was replaced"""
+        pass
+
+    def refresh_scan(self):
+        """The ranked table of the scanner changed"""
+        pass